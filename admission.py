@@ -0,0 +1,183 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def is_overloaded(status_code):
+    # responses telling the client to back off
+    return status_code == 429 or status_code >= 500
+
+
+class AimdLimiter:
+    """
+    Caps the requests in flight to one connector. The limit grows by one per limit successful requests
+    (additive increase) while it is in use, and is multiplied by backoff_ratio (multiplicative decrease) when a
+    request is rejected with 429/5xx, fails or takes longer than latency_threshold seconds. After a decrease,
+    further congestion signals are ignored for as long as the slow request took, because requests that were sent
+    before the decrease are expected to fail as well.
+    """
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=64, latency_threshold=2.0, backoff_ratio=0.5):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_threshold = latency_threshold
+        self.backoff_ratio = backoff_ratio
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self._quiet_until = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                raise TimeoutError("no request slot within " + str(timeout) + " s, limit " + str(int(self.limit)))
+            self.in_flight += 1
+
+    def release(self, latency, congested):
+        with self._condition:
+            in_use = self.in_flight >= int(self.limit) / 2
+            self.in_flight -= 1
+            now = time.monotonic()
+            if congested or latency > self.latency_threshold:
+                if now >= self._quiet_until:
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+                    self.decreases += 1
+                    self._quiet_until = now + latency
+            elif in_use and self.limit < self.max_limit:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+                self.increases += 1
+            self._condition.notify_all()
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average and bursts of up to burst requests, acquire() blocks until a token
+    is available.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.waited = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    self.waited += waited
+                    return waited
+                delay = (1.0 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AdmissionController:
+    """
+    Client-side admission control per connector (scheme://host:port): an AimdLimiter for the requests in flight
+    and optional token buckets, write_rate for requests that change state (creating assets, policies, negotiations,
+    transfers, ...) and poll_rate for reads (GET status requests and querySpec/catalog requests).
+    Pass it to EdcClient(admission=...) so every helper using that client is admitted through it.
+    """
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=64, latency_threshold=2.0, backoff_ratio=0.5,
+                 write_rate=None, poll_rate=None, burst=None, acquire_timeout=None):
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_threshold = latency_threshold
+        self.backoff_ratio = backoff_ratio
+        self.write_rate = write_rate
+        self.poll_rate = poll_rate
+        self.burst = burst
+        self.acquire_timeout = acquire_timeout
+        self._limiters = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def connector(url):
+        parts = urlsplit(url)
+        return parts.scheme + "://" + parts.netloc
+
+    @staticmethod
+    def kind(method, url):
+        if method == "GET" or urlsplit(url).path.rstrip("/").endswith("/request"):
+            return "poll"
+        return "write"
+
+    def limiter(self, connector):
+        with self._lock:
+            limiter = self._limiters.get(connector)
+            if limiter is None:
+                limiter = self._limiters[connector] = AimdLimiter(self.initial_limit, self.min_limit,
+                                                                  self.max_limit, self.latency_threshold,
+                                                                  self.backoff_ratio)
+            return limiter
+
+    def bucket(self, connector, kind):
+        rate = self.write_rate if kind == "write" else self.poll_rate
+        if rate is None:
+            return None
+        with self._lock:
+            bucket = self._buckets.get((connector, kind))
+            if bucket is None:
+                bucket = self._buckets[(connector, kind)] = TokenBucket(rate, self.burst)
+            return bucket
+
+    def send(self, method, url, send):
+        """
+        Runs send() once a token and a request slot for the connector of url are available and feeds the outcome
+        back into the limiter. Timeouts and connection errors count as congestion.
+        """
+        connector = self.connector(url)
+        bucket = self.bucket(connector, self.kind(method, url))
+        if bucket is not None:
+            bucket.acquire()
+        limiter = self.limiter(connector)
+        limiter.acquire(self.acquire_timeout)
+        start = time.perf_counter()
+        status_code = None
+        try:
+            response = send()
+            status_code = response.status_code
+            return response
+        finally:
+            limiter.release(time.perf_counter() - start, status_code is None or is_overloaded(status_code))
+
+    def snapshot(self):
+        with self._lock:
+            limiters = dict(self._limiters)
+            buckets = dict(self._buckets)
+        return {connector: {
+            "limit": int(limiter.limit),
+            "in_flight": limiter.in_flight,
+            "increases": limiter.increases,
+            "decreases": limiter.decreases,
+            "throttled_seconds": sum(bucket.waited for (bucket_connector, _), bucket in buckets.items()
+                                     if bucket_connector == connector)
+        } for connector, limiter in limiters.items()}
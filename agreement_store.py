@@ -0,0 +1,150 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import sqlite3
+import threading
+import time
+
+from icecream import ic
+
+from common import get_contract_agreement, get_agreement_negotiation, negotiate_offer, \
+    poll_negotiation_until_finalized
+from policy_index import policy_content_hash
+from polling import NEGOTIATION_FAILED_STATES
+
+
+class AgreementStore:
+    """
+    Persistent SQLite mapping of (provider, asset id, policy hash) to a contract agreement id. Policies are hashed
+    with policy_index.policy_content_hash, so offers differing only in ids or notation share an agreement.
+
+    Entries can carry a ttl after which they are evicted. lookup() checks the agreement against the consumer
+    connector before returning it and evicts entries the connector no longer knows (404) or whose negotiation was
+    terminated. Answers that can't confirm either, like a 5xx during a connector outage, keep the entry and return it
+    unverified, it is checked again on the next lookup.
+    """
+
+    def __init__(self, path="agreements.db", ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.unverified = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS agreements (
+                provider TEXT NOT NULL,
+                asset_id TEXT NOT NULL,
+                policy_hash TEXT NOT NULL,
+                agreement_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (provider, asset_id, policy_hash)
+            )""")
+        self._connection.commit()
+
+    def get(self, provider, asset_id, policy):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT agreement_id, expires_at FROM agreements "
+                "WHERE provider = ? AND asset_id = ? AND policy_hash = ?",
+                (provider, asset_id, policy_content_hash(policy))).fetchone()
+        if row is None:
+            return None
+        agreement_id, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self.evict(agreement_id)
+            return None
+        return agreement_id
+
+    def put(self, provider, asset_id, policy, agreement_id, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO agreements VALUES (?, ?, ?, ?, ?, ?)",
+                (provider, asset_id, policy_content_hash(policy), agreement_id, now, now + ttl if ttl is not None else None))
+            self._connection.commit()
+
+    def evict(self, agreement_id):
+        with self._lock:
+            self._connection.execute("DELETE FROM agreements WHERE agreement_id = ?", (agreement_id,))
+            self._connection.commit()
+
+    def evict_expired(self):
+        with self._lock:
+            deleted = self._connection.execute(
+                "DELETE FROM agreements WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)).rowcount
+            self._connection.commit()
+        return deleted
+
+    def lookup(self, provider, asset_id, policy, connector_management_url, edc_headers, client=None):
+        """
+        Returns a stored agreement id that the consumer connector still knows, or None.
+        """
+        agreement_id = self.get(provider, asset_id, policy)
+        if agreement_id is None:
+            self.misses += 1
+            return None
+        status_code, _ = get_contract_agreement(connector_management_url, agreement_id, edc_headers, client)
+        if status_code == 404:
+            self.evict(agreement_id)
+            self.misses += 1
+            return None
+        if status_code != 200:
+            # e.g. a 5xx during a connector outage, the entry is kept and checked again on the next lookup
+            self.unverified += 1
+        else:
+            status_code, negotiation = get_agreement_negotiation(connector_management_url, agreement_id, edc_headers,
+                                                                 client)
+            # connectors without the negotiation endpoint answer 404, only a terminated negotiation evicts
+            if status_code == 200 and isinstance(negotiation, dict) and \
+                    negotiation.get("state") in NEGOTIATION_FAILED_STATES:
+                self.evict(agreement_id)
+                self.misses += 1
+                return None
+        self.hits += 1
+        return agreement_id
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def negotiate_or_reuse(store, connector_id, consumer_id, provider_id, connector_address, policy, asset_id,
+                       connector_management_url, edc_headers, verbose=True, client=None, strategy=None, stats=None):
+    """
+    Returns the agreement id of a still valid agreement for the same provider, asset and policy from the store,
+    otherwise negotiates the offer, waits until the negotiation is finalized and stores the new agreement.
+    """
+    agreement_id = store.lookup(connector_address, asset_id, policy, connector_management_url, edc_headers, client)
+    if agreement_id is not None:
+        if verbose:
+            ic("Reusing contract agreement", agreement_id)
+        return agreement_id
+
+    negotiation_id = negotiate_offer(connector_id, consumer_id, provider_id, connector_address, policy,
+                                     connector_management_url, edc_headers, verbose, client)
+    agreement_id = poll_negotiation_until_finalized(connector_management_url, negotiation_id, edc_headers, verbose,
+                                                    client, strategy, stats)
+    store.put(connector_address, asset_id, policy, agreement_id)
+    return agreement_id
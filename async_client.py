@@ -0,0 +1,237 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from icecream import ic
+
+import common
+import instrumentation
+from client import EdcClient
+from journal import done, journaled, new_id
+from polling import PollStats, poll_until_async, NEGOTIATION_DONE_STATES, NEGOTIATION_FAILED_STATES, \
+    TRANSFER_DONE_STATES, TRANSFER_FAILED_STATES
+
+
+class AsyncEdcClient:
+    """
+    asyncio front end for the helpers in common.py.
+
+    Every request runs the corresponding sync helper on a dedicated worker pool with a shared pooled EdcClient,
+    so results are exactly those of the sync helpers. At most max_concurrency requests are in flight at the same
+    time, the poll loops wait on the event loop between requests and do not occupy a worker while sleeping.
+    Poll counts of all waits are aggregated in poll_stats.
+    All methods take the same arguments as the helpers in common.py except for client.
+    """
+
+    def __init__(self, max_concurrency=32, client=None, strategy=None):
+        self.max_concurrency = max_concurrency
+        self.strategy = strategy
+        self.poll_stats = PollStats()
+        self.client = client if client is not None else EdcClient(pool_size=max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="edc-client")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def call(self, func, *args, **kwargs):
+        # runs any helper that accepts a client argument within the concurrency limit
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            # the context carries the current instrumentation span over to the worker thread
+            return await loop.run_in_executor(self._executor, contextvars.copy_context().run,
+                                              functools.partial(func, *args, client=self.client, **kwargs))
+
+    async def create_dataplane(self, *args, **kwargs):
+        return await self.call(common.create_dataplane, *args, **kwargs)
+
+    async def create_asset(self, *args, **kwargs):
+        return await self.call(common.create_asset, *args, **kwargs)
+
+    async def create_policy(self, *args, **kwargs):
+        return await self.call(common.create_policy, *args, **kwargs)
+
+    async def create_contract_definition(self, *args, **kwargs):
+        return await self.call(common.create_contract_definition, *args, **kwargs)
+
+    async def query_catalog(self, *args, **kwargs):
+        return await self.call(common.query_catalog, *args, **kwargs)
+
+    async def negotiate_offer(self, *args, **kwargs):
+        return await self.call(common.negotiate_offer, *args, **kwargs)
+
+    async def get_negotiation(self, *args, **kwargs):
+        return await self.call(common.get_negotiation, *args, **kwargs)
+
+    async def initiate_data_transfer(self, *args, **kwargs):
+        return await self.call(common.initiate_data_transfer, *args, **kwargs)
+
+    async def get_transfer_process(self, *args, **kwargs):
+        return await self.call(common.get_transfer_process, *args, **kwargs)
+
+    async def deprovision_s3_token(self, *args, **kwargs):
+        return await self.call(common.deprovision_s3_token, *args, **kwargs)
+
+    async def poll_negotiation_until_finalized(self, connector_management_url, negotiation_id, edc_headers,
+                                               verbose=True, strategy=None):
+        async def fetch():
+            if common.log_enabled(verbose):
+                ic("Requesting status of negotiation")
+            return await self.get_negotiation(connector_management_url, negotiation_id, edc_headers)
+
+        with instrumentation.span("poll_negotiation_until_finalized") as span:
+            status_code, negotiation, polls = await poll_until_async(fetch, "negotiation " + negotiation_id,
+                                                                     NEGOTIATION_DONE_STATES,
+                                                                     NEGOTIATION_FAILED_STATES,
+                                                                     strategy or self.strategy, self.poll_stats,
+                                                                     common.poll_logger(verbose))
+            span.annotate(polls=polls)
+        if common.log_enabled(verbose):
+            ic(status_code, negotiation, polls)
+        return negotiation["contractAgreementId"]
+
+    async def poll_transfer_until_completed(self, connector_management_url, transfer_id, edc_headers, verbose=True,
+                                            strategy=None):
+        async def fetch():
+            if common.log_enabled(verbose):
+                ic("Requesting status of transfer")
+            return await self.get_transfer_process(connector_management_url, transfer_id, edc_headers)
+
+        with instrumentation.span("poll_transfer_until_completed") as span:
+            status_code, transfer, polls = await poll_until_async(fetch, "transfer " + transfer_id,
+                                                                  TRANSFER_DONE_STATES, TRANSFER_FAILED_STATES,
+                                                                  strategy or self.strategy, self.poll_stats,
+                                                                  common.poll_logger(verbose))
+            span.annotate(polls=polls)
+        if common.log_enabled(verbose):
+            ic(status_code, transfer, polls)
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+@contextlib.contextmanager
+def timed(timings, phase):
+    # stores the duration of the with block as timings[phase], timings may be None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[phase] = time.perf_counter() - start
+
+
+async def run_transfer_flow(aclient, asset_id, data_address, data_destination, provider_management_url,
+                            provider_dsp_url, provider_headers, consumer_management_url, consumer_headers,
+                            connector_id="provider", policy_id=None, deprovision=False, verbose=True, timings=None,
+                            journal=None):
+    """
+    Full provider/consumer flow for a single asset: asset, policy, contract definition, catalog, negotiation and
+    transfer. Returns the ids created along the way. If timings is a dict, the duration of every phase in seconds is
+    stored in it under the phase name (asset, policy, contract_definition, catalog, negotiation_request,
+    negotiation, transfer_request, transfer, deprovision).
+    With a journal.FlowJournal, every step is journaled under the asset id. Running the flow again with the same
+    asset id and a resumed journal skips the finished steps and waits for a journaled negotiation or transfer
+    instead of starting a new one.
+    """
+    flow = asset_id
+    if journal is not None and journal.get(flow, "completed") is not None:
+        return journal.get(flow, "completed")
+
+    with instrumentation.span("transfer_flow", asset_id=asset_id):
+        with timed(timings, "asset"):
+            asset_id = await journaled(journal, flow, "asset", lambda: aclient.create_asset(
+                asset_id, "My Asset", "Description", "v1.2.3", "application/json", data_address,
+                provider_management_url, provider_headers, verbose), created_id=asset_id)
+        if policy_id is None:
+            with timed(timings, "policy"):
+                policy_id = await journaled(journal, flow, "policy", lambda: aclient.create_policy(
+                    asset_id + "-policy", provider_management_url, provider_headers, verbose),
+                                            created_id=asset_id + "-policy")
+        # a fixed id lets a resumed flow recognize the definition it created before
+        contract_definition_id = asset_id + "-definition" if journal is not None else None
+        with timed(timings, "contract_definition"):
+            await journaled(journal, flow, "contract_definition", lambda: aclient.create_contract_definition(
+                policy_id, policy_id, asset_id, provider_management_url, provider_headers, verbose,
+                contract_definition_id=contract_definition_id), created_id=contract_definition_id)
+
+        async def negotiate():
+            # only ask for the dataset of this asset, the catalog of a busy provider does not fit into one page
+            with timed(timings, "catalog"):
+                datasets = await aclient.query_catalog(provider_dsp_url, consumer_management_url, consumer_headers,
+                                                       verbose, query_spec=common.create_query_spec(filter_expression=[
+                                                           common.create_criterion(
+                                                               "https://w3id.org/edc/v0.0.1/ns/id", "=", asset_id)]))
+            offering_data = common.find_offer(datasets, asset_id)
+            if offering_data is None:
+                raise LookupError("asset " + asset_id + " not found in catalog of " + provider_dsp_url)
+            with timed(timings, "negotiation_request"):
+                return await aclient.negotiate_offer(connector_id, "consumer", connector_id, provider_dsp_url,
+                                                     offering_data["odrl:hasPolicy"], consumer_management_url,
+                                                     consumer_headers, verbose)
+
+        agreement_id = journal.get(flow, "agreement") if journal is not None else None
+        negotiation_id = journal.get(flow, "negotiation") if journal is not None else None
+        if agreement_id is None:
+            negotiation_id = await journaled(journal, flow, "negotiation", negotiate)
+            with timed(timings, "negotiation"):
+                agreement_id = await journaled(journal, flow, "agreement",
+                                               lambda: aclient.poll_negotiation_until_finalized(
+                                                   consumer_management_url, negotiation_id, consumer_headers,
+                                                   verbose))
+
+        # the transfer id is journaled before it is requested, so a resumed flow can't start a second transfer
+        transfer_id = await journaled(journal, flow, "transfer_id", new_id)
+        with timed(timings, "transfer_request"):
+            transfer_id = await journaled(journal, flow, "transfer", lambda: aclient.initiate_data_transfer(
+                connector_id, provider_dsp_url, agreement_id, asset_id, data_destination, consumer_management_url,
+                consumer_headers, verbose, transfer_id=transfer_id), created_id=transfer_id)
+        with timed(timings, "transfer"):
+            await journaled(journal, flow, "transfer_completed", lambda: done(
+                aclient.poll_transfer_until_completed(consumer_management_url, transfer_id, consumer_headers,
+                                                      verbose)))
+        if deprovision:
+            with timed(timings, "deprovision"):
+                await journaled(journal, flow, "deprovisioned", lambda: done(
+                    aclient.deprovision_s3_token(consumer_management_url, transfer_id, consumer_headers, verbose)))
+
+        result = {
+            "asset_id": asset_id,
+            "policy_id": policy_id,
+            "negotiation_id": negotiation_id,
+            "agreement_id": agreement_id,
+            "transfer_id": transfer_id
+        }
+        if journal is not None:
+            journal.record(flow, "completed", result)
+        return result
+
+
+async def run_transfer_flows(aclient, flows, return_exceptions=True):
+    """
+    Runs many run_transfer_flow calls concurrently, flows is an iterable of keyword argument dicts.
+    """
+    return await asyncio.gather(*(run_transfer_flow(aclient, **flow) for flow in flows),
+                                return_exceptions=return_exceptions)
@@ -0,0 +1,87 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+from icecream import ic
+
+from client import EdcClient
+from common import create_http_dataaddress, create_policy, create_query_spec, delete_contract_definition, \
+    query_catalog, edc1_headers, edc2_headers
+from provisioning import create_asset_spec, provision_assets, run_bulk
+
+"""
+Compares catalog response times of the consumer for one contract definition per asset against grouped contract
+definitions with "id in [...]" selectors. Needs a running provider and consumer connector.
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--provider-management-url", default="http://localhost:19193/management/")
+parser.add_argument("--provider-dsp-url", default="http://localhost:19194/protocol")
+parser.add_argument("--consumer-management-url", default="http://localhost:29193/management/")
+parser.add_argument("--assets", type=int, default=1000)
+parser.add_argument("--group-size", type=int, default=1000, help="maximum number of assets per grouped definition")
+parser.add_argument("--queries", type=int, default=20, help="number of catalog requests per variant")
+parser.add_argument("--workers", type=int, default=16)
+args = parser.parse_args()
+
+ic.disable()
+client = EdcClient(pool_size=args.workers)
+
+
+def measure_catalog():
+    durations = []
+    for _ in range(args.queries):
+        start = time.perf_counter()
+        query_catalog(args.provider_dsp_url, args.consumer_management_url, edc1_headers, verbose=False, client=client,
+                      query_spec=create_query_spec(limit=args.assets))
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def list_contract_definitions():
+    response = client.post(args.provider_management_url + "v2/contractdefinitions/request", headers=edc2_headers,
+                           json=create_query_spec(limit=10 * args.assets))
+    return [definition["@id"] for definition in response.json()]
+
+
+def run_variant(label, grouped, policy_id):
+    existing = set(list_contract_definitions())
+    specs = [create_asset_spec(label + "-" + str(uuid.uuid4()),
+                               create_http_dataaddress("benchmark", "https://jsonplaceholder.typicode.com/users"))
+             for _ in range(args.assets)]
+    provisioned = provision_assets(specs, args.provider_management_url, edc2_headers, access_policy_id=policy_id,
+                                   workers=args.workers, client=client, grouped=grouped,
+                                   max_assets_per_definition=args.group_size)
+    created = [definition_id for definition_id in list_contract_definitions() if definition_id not in existing]
+
+    durations = measure_catalog()
+    print(f"{label:>9}: {len(created)} contract definitions, {len(provisioned.failed)} failed assets, "
+          f"catalog p50 {statistics.median(durations) * 1000:.1f} ms, max {max(durations) * 1000:.1f} ms")
+
+    # remove the definitions again so the next variant is measured on its own
+    run_bulk(created, lambda definition_id: delete_contract_definition(definition_id, args.provider_management_url,
+                                                                       edc2_headers, verbose=False, client=client),
+             args.workers)
+
+
+policy_id = create_policy("benchmark-" + str(uuid.uuid4()), args.provider_management_url, edc2_headers,
+                          verbose=False, client=client)
+run_variant("per-asset", False, policy_id)
+run_variant("grouped", True, policy_id)
+client.close()
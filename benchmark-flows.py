@@ -0,0 +1,253 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import argparse
+import asyncio
+import contextlib
+import math
+import time
+import uuid
+from types import SimpleNamespace
+
+from icecream import ic
+
+import codec
+import instrumentation
+from admission import AdmissionController
+from async_client import AsyncEdcClient, run_transfer_flow
+from cassette import CassettePlayer, CassetteRecorder
+from client import EdcClient
+from common import create_http_dataaddress, create_http_proxy_dataaddress, create_s3_dataaddress_source, \
+    create_s3_dataaddress_destination, edc1_headers, edc2_headers
+from pipeline import FlowPipeline, STAGES
+from polling import PollingStrategy
+from resilience import Resilience
+from stub_connector import StubConnector
+
+"""
+Runs the s3-push, http-pull and http-push flows against two local stub connectors (see stub_connector.py) and
+reports p50/p95/p99 latency per phase and flows/s, to measure the client side of the flows without Java connectors.
+With --record the exchanges are written to a cassette, --replay answers them from a cassette without any connector.
+"""
+
+PHASES = ("asset", "policy", "contract_definition", "catalog", "negotiation_request", "negotiation",
+          "transfer_request", "transfer", "deprovision", "total")
+
+
+def percentile(sorted_values, p):
+    # nearest rank percentile of an already sorted list
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def flow_arguments(flow, asset_id):
+    if flow == "s3-push":
+        return {
+            "data_address": create_s3_dataaddress_source("s3-eu-central-2.ionoscloud.com", "provider-bucket",
+                                                         "testfolder/"),
+            "data_destination": create_s3_dataaddress_destination("s3-eu-central-2.ionoscloud.com",
+                                                                  "consumer-bucket", "myTargetPath/" + asset_id + "/"),
+            "connector_id": "edc2",
+            "deprovision": True
+        }
+    if flow == "http-pull":
+        return {
+            "data_address": create_http_dataaddress("My Asset", "https://jsonplaceholder.typicode.com/users"),
+            "data_destination": create_http_proxy_dataaddress()
+        }
+    return {
+        "data_address": create_http_dataaddress("My Asset", "https://jsonplaceholder.typicode.com/users"),
+        "data_destination": create_http_dataaddress("", "http://localhost:4000/api/consumer/store")
+    }
+
+
+async def run_pipelined_flows(flow, flows, concurrency, provider, consumer, strategy, make_client):
+    timings = []
+    async with AsyncEdcClient(max_concurrency=concurrency * 4, client=make_client(concurrency * 4),
+                              strategy=strategy) as aclient:
+        if flow == "http-pull":
+            for connector, headers in ((provider, edc2_headers), (consumer, edc1_headers)):
+                await aclient.create_dataplane("http://localhost/control/transfer", "http://localhost/public/",
+                                               connector.management_url, headers, verbose=False)
+        connector_id = "edc2" if flow == "s3-push" else "provider"
+        pipeline = FlowPipeline(aclient, provider.management_url, provider.dsp_url, edc2_headers,
+                                consumer.management_url, edc1_headers, connector_id=connector_id,
+                                deprovision=flow == "s3-push", workers={stage: concurrency for stage in STAGES},
+                                queue_size=concurrency)
+        start = time.perf_counter()
+        asset_ids = [flow + "-" + str(uuid.uuid4()) for _ in range(flows)]
+        results = await pipeline.run(({"asset_id": asset_id, **flow_arguments(flow, asset_id)}
+                                      for asset_id in asset_ids), timings)
+        elapsed = time.perf_counter() - start
+    for name, state in pipeline.snapshot().items():
+        print(f"  stage {name:<12} {state}")
+    print("  bottleneck: " + pipeline.bottleneck())
+    return timings, [result for result in results if isinstance(result, Exception)], elapsed
+
+
+async def run_flows(flow, flows, concurrency, provider, consumer, strategy, make_client):
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+    failures = []
+
+    async def run_one(aclient):
+        async with semaphore:
+            flow_timings = {}
+            start = time.perf_counter()
+            asset_id = flow + "-" + str(uuid.uuid4())
+            try:
+                await run_transfer_flow(aclient, asset_id,
+                                        provider_management_url=provider.management_url,
+                                        provider_dsp_url=provider.dsp_url, provider_headers=edc2_headers,
+                                        consumer_management_url=consumer.management_url,
+                                        consumer_headers=edc1_headers, verbose=False, timings=flow_timings,
+                                        **flow_arguments(flow, asset_id))
+            except Exception as e:
+                failures.append(e)
+                return
+            flow_timings["total"] = time.perf_counter() - start
+            timings.append(flow_timings)
+
+    # every flow has at most one request in flight
+    async with AsyncEdcClient(max_concurrency=concurrency, client=make_client(concurrency),
+                              strategy=strategy) as aclient:
+        if flow == "http-pull":
+            for connector, headers in ((provider, edc2_headers), (consumer, edc1_headers)):
+                await aclient.create_dataplane("http://localhost/control/transfer", "http://localhost/public/",
+                                               connector.management_url, headers, verbose=False)
+        start = time.perf_counter()
+        await asyncio.gather(*(run_one(aclient) for _ in range(flows)))
+        elapsed = time.perf_counter() - start
+    return timings, failures, elapsed
+
+
+def report(flow, timings, failures, elapsed):
+    print(f"\n{flow}: {len(timings)} flows succeeded, {len(failures)} failed in {elapsed:.2f} s, "
+          f"{len(timings) / elapsed:.1f} flows/s")
+    if failures:
+        print(f"  first failure: {failures[0]!r}")
+        print(f"  last failure: {failures[-1]!r}")
+    print(f"  {'phase':<20} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for phase in PHASES:
+        values = sorted(flow_timings[phase] for flow_timings in timings if phase in flow_timings)
+        if values:
+            print(f"  {phase:<20} {len(values):>6} " +
+                  " ".join(f"{percentile(values, p) * 1000:>9.1f}" for p in (50, 95, 99)))
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--flow", choices=("s3-push", "http-pull", "http-push", "all"), default="all")
+parser.add_argument("--flows", type=int, default=100, help="number of flows per flow type")
+parser.add_argument("--concurrency", type=int, default=16, help="number of flows running at the same time")
+parser.add_argument("--pipeline", action="store_true",
+                    help="run the flows as staged pipeline with --concurrency workers per stage")
+parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every stub response")
+parser.add_argument("--latency-jitter", type=float, default=0.2)
+parser.add_argument("--negotiation-seconds", type=float, default=0.5)
+parser.add_argument("--transfer-seconds", type=float, default=0.5)
+parser.add_argument("--failure-rate", type=float, default=0.0)
+parser.add_argument("--capacity", type=int, help="requests a stub accepts at the same time before answering 429")
+parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub requests answered with 503")
+parser.add_argument("--retries", type=int, help="retry failed requests up to this many times (with circuit breaker)")
+parser.add_argument("--adaptive", action="store_true", help="limit requests in flight per connector (AIMD)")
+parser.add_argument("--write-rate", type=float, help="write requests per second and connector")
+parser.add_argument("--poll-rate", type=float, help="status and query requests per second and connector")
+parser.add_argument("--poll-interval", type=float, help="poll at a fixed interval instead of the default backoff")
+parser.add_argument("--json-backend", choices=sorted(codec.BACKENDS), default="json")
+parser.add_argument("--spans", help="append every operation span as a JSON line to this file")
+parser.add_argument("--prometheus", help="write per-operation metrics in Prometheus text format to this file")
+parser.add_argument("--record", metavar="CASSETTE", help="record every management API exchange to this cassette")
+parser.add_argument("--replay", metavar="CASSETTE",
+                    help="answer the requests from this cassette instead of stub connectors")
+parser.add_argument("--time-scale", type=float, default=1.0,
+                    help="factor for the recorded per-response latency when replaying, 0 answers at once; the "
+                         "gaps between requests are not replayed")
+args = parser.parse_args()
+
+stub_options = {
+    "latency": args.latency,
+    "latency_jitter": args.latency_jitter,
+    "negotiation_seconds": args.negotiation_seconds,
+    "transfer_seconds": args.transfer_seconds,
+    "failure_rate": args.failure_rate,
+    "capacity": args.capacity,
+    "error_rate": args.error_rate
+}
+admission = None
+if args.adaptive or args.write_rate or args.poll_rate:
+    admission = AdmissionController(initial_limit=args.concurrency if args.adaptive else args.concurrency * 4,
+                                    max_limit=args.concurrency * 4, write_rate=args.write_rate,
+                                    poll_rate=args.poll_rate)
+resilience = Resilience(attempts=args.retries + 1, reset_timeout=1.0) if args.retries else None
+strategy = PollingStrategy.fixed(args.poll_interval, deadline=600.0) if args.poll_interval else None
+
+codec.set_backend(args.json_backend)
+
+# icecream formats every payload, which would dominate the measurement
+ic.disable()
+
+exporters = []
+if args.spans:
+    exporters.append(instrumentation.JsonLinesExporter(args.spans))
+if args.prometheus:
+    exporters.append(instrumentation.PrometheusExporter(args.prometheus))
+if exporters:
+    instrumentation.set_recorder(instrumentation.Recorder(*exporters))
+
+with contextlib.ExitStack() as stack:
+    player = recorder = None
+    if args.replay:
+        player = CassettePlayer(args.replay, time_scale=args.time_scale)
+        provider = SimpleNamespace(management_url=player.metadata["provider_management_url"],
+                                   dsp_url=player.metadata["provider_dsp_url"])
+        consumer = SimpleNamespace(management_url=player.metadata["consumer_management_url"])
+    else:
+        provider = stack.enter_context(StubConnector(participant_id="provider", **stub_options))
+        consumer = stack.enter_context(StubConnector(participant_id="consumer", **stub_options))
+    if args.record:
+        recorder = stack.enter_context(CassetteRecorder(args.record, metadata={
+            "provider_management_url": provider.management_url,
+            "provider_dsp_url": provider.dsp_url,
+            "consumer_management_url": consumer.management_url
+        }))
+
+    def make_client(pool_size):
+        if player is not None:
+            return player
+        client = EdcClient(pool_size=pool_size, admission=admission, resilience=resilience)
+        return recorder.wrap(client) if recorder is not None else client
+
+    for flow in (("s3-push", "http-pull", "http-push") if args.flow == "all" else (args.flow,)):
+        runner = run_pipelined_flows if args.pipeline else run_flows
+        report(flow, *asyncio.run(runner(flow, args.flows, args.concurrency, provider, consumer, strategy,
+                                         make_client)))
+        if admission is not None:
+            for connector, state in admission.snapshot().items():
+                print(f"  {connector}: {state}")
+        if resilience is not None:
+            print(f"  {resilience.snapshot()}")
+        if player is not None:
+            print(f"  cassette: {player.snapshot()}")
+    if recorder is not None:
+        print(f"\nrecorded {recorder.exchanges} exchanges to {args.record}")
+    if player is None:
+        print("\nrequests served: provider " + str(sum(provider.requests.values())) + ", consumer " +
+              str(sum(consumer.requests.values())))
+        for route, count in sorted((consumer.requests + provider.requests).items()):
+            print(f"  {route:<32} {count:>7}")
+
+if exporters:
+    instrumentation.set_recorder(None)
+    for exporter in exporters:
+        exporter.close()
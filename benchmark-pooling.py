@@ -0,0 +1,79 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from icecream import ic
+
+from client import EdcClient
+from common import create_policy, edc2_headers
+
+"""
+Measures the per-call overhead of the management API helpers with and without connection pooling.
+Without --url a local keep-alive HTTP server answering like the policy endpoint is started.
+"""
+
+
+class _PolicyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"@id": "aPolicy"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(client, management_url, calls):
+    for i in range(calls):
+        create_policy("benchmark-policy-" + str(i), management_url, edc2_headers, verbose=False, client=client)
+    return client.stats
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--url", help="management url of a running connector, e.g. http://localhost:19193/management/")
+parser.add_argument("--calls", type=int, default=500)
+parser.add_argument("--pool-size", type=int, default=10)
+args = parser.parse_args()
+
+server = None
+management_url = args.url
+if management_url is None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _PolicyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    management_url = "http://127.0.0.1:" + str(server.server_address[1]) + "/management/"
+
+# icecream prints every payload, which would dominate the measurement
+ic.disable()
+
+for label, pooled in (("unpooled", False), ("pooled", True)):
+    with EdcClient(pool_size=args.pool_size, pooled=pooled) as client:
+        stats = run(client, management_url, args.calls)
+        connections = client.connections_opened() if pooled else stats.calls
+        print(f"{label:>8}: {stats.calls} calls, {stats.mean_seconds * 1000:.3f} ms/call, "
+              f"{connections} connections opened")
+
+if server is not None:
+    server.shutdown()
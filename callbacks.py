@@ -0,0 +1,323 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from icecream import ic
+
+from common import poll_negotiation_until_finalized, poll_transfer_until_completed
+from polling import PollFailedError
+
+NEGOTIATION_EVENTS = {
+    "ContractNegotiationFinalized": True,
+    "ContractNegotiationTerminated": False,
+}
+TRANSFER_EVENTS = {
+    "TransferProcessCompleted": True,
+    "TransferProcessTerminated": False,
+}
+
+_REASONS = {200: "OK", 204: "No Content", 206: "Partial Content", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+            405: "Method Not Allowed", 409: "Conflict", 429: "Too Many Requests", 500: "Internal Server Error",
+            416: "Range Not Satisfiable", 503: "Service Unavailable"}
+
+
+async def read_request_head(reader):
+    """
+    Reads request line and headers of an HTTP/1.1 request, returns (method, path, headers) or None on EOF.
+    Header names are lower case.
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return method, path, headers
+
+
+async def iter_body(reader, headers, chunk_size=65536):
+    """
+    Yields the request body in chunks, handling both Content-Length and chunked transfer encoding.
+    """
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";", 1)[0], 16)
+            if size == 0:
+                # skip trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            remaining = size
+            while remaining:
+                chunk = await reader.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise ConnectionError("connection closed in chunked body")
+                remaining -= len(chunk)
+                yield chunk
+            await reader.readline()
+    else:
+        remaining = int(headers.get("content-length", 0))
+        while remaining:
+            chunk = await reader.read(min(chunk_size, remaining))
+            if not chunk:
+                raise ConnectionError("connection closed in body")
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def read_body(reader, headers):
+    return b"".join([chunk async for chunk in iter_body(reader, headers)])
+
+
+async def write_response(writer, status, body=b"", content_type="application/json", headers=None):
+    extra = "".join(name + ": " + value + "\r\n" for name, value in (headers or {}).items())
+    writer.write(("HTTP/1.1 " + str(status) + " " + _REASONS.get(status, "") + "\r\n" +
+                  "Content-Type: " + content_type + "\r\n" + extra +
+                  "Content-Length: " + str(len(body)) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+class EmbeddedHttpServer:
+    """
+    Minimal HTTP/1.1 server running its own asyncio loop on a daemon thread, so it can be used next to the sync
+    helpers. Subclasses implement handle(method, path, headers, reader), which must consume the request body and
+    returns (status, response body) or (status, response body, dict of extra response headers). Pass public_url if the connector reaches this machine under a different address
+    than host:port.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, path="/", public_url=None, name="edc-http-server"):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.public_url = public_url
+        self.name = name
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        if self.public_url is not None:
+            return self.public_url
+        return "http://" + self.host + ":" + str(self.port) + self.path
+
+    async def handle(self, method, path, headers, reader):
+        await read_body(reader, headers)
+        return 404, b""
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._serve, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            # keep-alive connections of pooled clients would otherwise keep their handlers waiting forever
+            handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in handlers:
+                task.cancel()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                head = await read_request_head(reader)
+                if head is None:
+                    break
+                method, path, headers = head
+                status, body, *extra = await self.handle(method, path, headers, reader)
+                await write_response(writer, status, body, headers=extra[0] if extra else None)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, ValueError, asyncio.CancelledError):
+            # cancelled on stop while waiting for the next request of a keep-alive connection
+            pass
+        finally:
+            writer.close()
+
+
+class CallbackReceiver(EmbeddedHttpServer):
+    """
+    Embedded HTTP server receiving the events the connector sends to registered callback addresses.
+
+    expect() returns a concurrent.futures.Future per negotiation or transfer id that resolves with the event payload
+    once a finalized/completed event arrives and fails with PollFailedError on a terminated event. Events that
+    arrive before expect() is called are kept (up to max_buffered) so fast processes are not missed.
+    From a coroutine, await asyncio.wrap_future(receiver.expect(process_id)).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, path="/callbacks", public_url=None, max_buffered=10000,
+                 verbose=False):
+        super().__init__(host, port, path, public_url, name="edc-callback-receiver")
+        self.max_buffered = max_buffered
+        self.verbose = verbose
+        self.events_received = 0
+        self._futures = {}
+        self._buffered = OrderedDict()
+        self._lock = threading.Lock()
+
+    def callback_addresses(self, events=("contract.negotiation", "transfer.process")):
+        return [{
+            "@type": "CallbackAddress",
+            "uri": self.url,
+            "events": list(events),
+            "transactional": False
+        }]
+
+    def expect(self, process_id):
+        with self._lock:
+            future = self._futures.get(process_id)
+            if future is not None:
+                return future
+            future = Future()
+            buffered = self._buffered.pop(process_id, None)
+            if buffered is None:
+                self._futures[process_id] = future
+                return future
+        self._complete(future, process_id, *buffered)
+        return future
+
+    def forget(self, process_id):
+        with self._lock:
+            self._futures.pop(process_id, None)
+
+    @staticmethod
+    def _complete(future, process_id, event_type, success, payload):
+        if future.done():
+            return
+        if success:
+            future.set_result(payload)
+        else:
+            future.set_exception(PollFailedError(process_id + " received " + event_type,
+                                                 state=event_type, body=payload))
+
+    def _on_event(self, event):
+        event_type = event.get("type")
+        payload = event.get("payload") or {}
+        if event_type in NEGOTIATION_EVENTS:
+            process_id, success = payload.get("contractNegotiationId"), NEGOTIATION_EVENTS[event_type]
+        elif event_type in TRANSFER_EVENTS:
+            process_id, success = payload.get("transferProcessId"), TRANSFER_EVENTS[event_type]
+        else:
+            return
+        if process_id is None:
+            return
+        with self._lock:
+            future = self._futures.pop(process_id, None)
+            if future is None:
+                self._buffered[process_id] = (event_type, success, payload)
+                while len(self._buffered) > self.max_buffered:
+                    self._buffered.popitem(last=False)
+                return
+        self._complete(future, process_id, event_type, success, payload)
+
+    async def handle(self, method, path, headers, reader):
+        body = await read_body(reader, headers)
+        if method != "POST":
+            return 405, b""
+        try:
+            event = json.loads(body)
+        except ValueError:
+            return 400, b""
+        # a valid JSON document that is no event object would otherwise drop the connection without a response
+        if not isinstance(event, dict) or not isinstance(event.get("payload") or {}, dict):
+            return 400, b""
+        self.events_received += 1
+        if self.verbose:
+            ic(event.get("type"), event.get("payload"))
+        self._on_event(event)
+        return 204, b""
+
+
+def _wait_for_event(receiver, process_id, event_timeout):
+    try:
+        return receiver.expect(process_id).result(timeout=event_timeout)
+    except FutureTimeoutError:
+        receiver.forget(process_id)
+        return None
+
+
+def wait_for_negotiation(receiver, connector_management_url, negotiation_id, edc_headers, event_timeout=30.0,
+                         verbose=True, client=None, strategy=None, stats=None):
+    """
+    Waits for the negotiation finalized event and returns the agreement id. Falls back to polling if no event
+    arrived within event_timeout seconds.
+    """
+    payload = _wait_for_event(receiver, negotiation_id, event_timeout) or {}
+    agreement = payload.get("contractAgreement") or {}
+    agreement_id = agreement.get("id") or agreement.get("@id")
+    if agreement_id is not None:
+        if verbose:
+            ic("Negotiation finalized event received", negotiation_id)
+        return agreement_id
+    if verbose:
+        ic("No negotiation event received, falling back to polling", negotiation_id)
+    return poll_negotiation_until_finalized(connector_management_url, negotiation_id, edc_headers, verbose, client,
+                                            strategy, stats)
+
+
+def wait_for_transfer(receiver, connector_management_url, transfer_id, edc_headers, event_timeout=30.0,
+                      verbose=True, client=None, strategy=None, stats=None):
+    """
+    Waits for the transfer completed event. Falls back to polling if no event arrived within event_timeout seconds.
+    """
+    if _wait_for_event(receiver, transfer_id, event_timeout) is not None:
+        if verbose:
+            ic("Transfer completed event received", transfer_id)
+        return
+    if verbose:
+        ic("No transfer event received, falling back to polling", transfer_id)
+    poll_transfer_until_completed(connector_management_url, transfer_id, edc_headers, verbose, client, strategy,
+                                  stats)
@@ -0,0 +1,266 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import json
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import urlencode, urlsplit
+
+import requests
+
+UUID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+class CassetteMissError(LookupError):
+    pass
+
+
+def canonical_body(data=None, json_body=None):
+    # JSON bodies with sorted keys and without whitespace, so the JSON backend does not matter for matching
+    if json_body is not None:
+        return json.dumps(json_body, sort_keys=True, separators=(",", ":"))
+    if data is None:
+        return ""
+    if isinstance(data, bytes):
+        data = data.decode()
+    try:
+        return json.dumps(json.loads(data), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        return data
+
+
+def request_key(method, url, params=None, body=""):
+    parts = urlsplit(url)
+    query = urlencode(sorted(params.items())) if params else parts.query
+    return method + " " + parts.scheme + "://" + parts.netloc + parts.path + ("?" + query if query else "") + "\n" + \
+        body
+
+
+class CassetteRecorder:
+    """
+    Writes every management API exchange of the clients returned by wrap() to a cassette, a JSON lines file whose
+    first line holds metadata (e.g. the connector URLs of the run) and every further line one exchange: request
+    method, URL and body, response status, content type and body, and how long the response took.
+    """
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.exchanges = 0
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._file = open(path, "w")
+        self._file.write(json.dumps({"metadata": metadata or {}}) + "\n")
+
+    def wrap(self, client=None):
+        return _RecordingClient(self, client if client is not None else requests)
+
+    def record(self, method, url, params, body, response, start, elapsed):
+        line = json.dumps({
+            "at": round(start - self.start, 6),
+            "elapsed": round(elapsed, 6),
+            "method": method,
+            "url": url,
+            "params": params,
+            "body": body,
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type"),
+            "response": response.text
+        })
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.exchanges += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _RecordingClient:
+    # same interface as client.EdcClient, records every request that received a response
+
+    def __init__(self, recorder, client):
+        self._recorder = recorder
+        self._client = client
+
+    def request(self, method, url, params=None, data=None, json=None, **kwargs):
+        start = time.perf_counter()
+        response = self._client.request(method, url, params=params, data=data, json=json, **kwargs)
+        self._recorder.record(method, url, params, canonical_body(data, json), response, start,
+                              time.perf_counter() - start)
+        return response
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.request("POST", url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request("PUT", url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        if hasattr(self._client, "close"):
+            self._client.close()
+
+
+class CassettePlayer:
+    """
+    Client (same interface as client.EdcClient) answering requests from a cassette written by CassetteRecorder,
+    without any connector. Every response is delayed by its recorded duration times time_scale (0 answers at once).
+    Only this per-response latency is replayed: the recorded "at" offsets are ignored, so the gaps between requests
+    come from the replaying client (its concurrency, poll intervals, ...), not from the recorded run.
+
+    Requests are matched on method, URL and body. Ids the client generates itself (uuids in asset ids, transfer
+    ids, ...) differ from the recorded ones: a request that only differs from a recorded one in such uuids is matched
+    to the first recorded request of that shape, and its uuids are mapped to the recorded ones from then on, in
+    requests as well as (reversed) in responses. Status requests repeated more often than recorded get the last
+    recorded response again. Requests without a match raise CassetteMissError.
+    """
+
+    def __init__(self, path, time_scale=1.0):
+        self.path = path
+        self.time_scale = time_scale
+        self.replayed = 0
+        self.repeated = 0
+        self.learned = 0
+        self.misses = 0
+        self._exact = {}
+        self._shapes = {}
+        self._last = {}
+        self._known = set()
+        self._to_recorded = {}
+        self._to_replayed = {}
+        self._lock = threading.Lock()
+        with open(path) as f:
+            self.metadata = json.loads(f.readline())["metadata"]
+            for line in f:
+                if not line.strip():
+                    continue
+                exchange = json.loads(line)
+                exchange["key"] = request_key(exchange["method"], exchange["url"], exchange["params"],
+                                              exchange["body"])
+                exchange["used"] = False
+                self._exact.setdefault(exchange["key"], deque()).append(exchange)
+                self._shapes.setdefault(UUID_PATTERN.sub("*", exchange["key"]), deque()).append(exchange)
+                self._known.update(UUID_PATTERN.findall(exchange["key"]))
+                self._known.update(UUID_PATTERN.findall(exchange["response"]))
+
+    @staticmethod
+    def _pop(exchanges):
+        while exchanges:
+            exchange = exchanges.popleft()
+            if not exchange["used"]:
+                exchange["used"] = True
+                return exchange
+        return None
+
+    def _consistent(self, replayed_ids, recorded_ids):
+        # a recorded request can stand for this one if every differing uuid is one the client generated itself
+        for replayed, recorded in zip(replayed_ids, recorded_ids):
+            if replayed != recorded and (replayed in self._known or recorded in self._to_replayed):
+                return False
+        return True
+
+    def _match(self, key):
+        key = UUID_PATTERN.sub(lambda m: self._to_recorded.get(m.group(0), m.group(0)), key)
+        exchange = self._pop(self._exact.get(key))
+        if exchange is not None:
+            self._last[key] = exchange
+            return exchange
+        if key in self._last:
+            self.repeated += 1
+            return self._last[key]
+        candidates = self._shapes.get(UUID_PATTERN.sub("*", key))
+        while candidates and candidates[0]["used"]:
+            candidates.popleft()
+        if not candidates:
+            return None
+        replayed_ids = UUID_PATTERN.findall(key)
+        for exchange in candidates:
+            recorded_ids = UUID_PATTERN.findall(exchange["key"])
+            if not exchange["used"] and self._consistent(replayed_ids, recorded_ids):
+                break
+        else:
+            return None
+        exchange["used"] = True
+        for replayed, recorded in zip(replayed_ids, recorded_ids):
+            if replayed != recorded and replayed not in self._to_recorded:
+                self._to_recorded[replayed] = recorded
+                self._to_replayed[recorded] = replayed
+                self.learned += 1
+        self._last[exchange["key"]] = exchange
+        return exchange
+
+    def request(self, method, url, params=None, data=None, json=None, **kwargs):
+        key = request_key(method, url, params, canonical_body(data, json))
+        with self._lock:
+            exchange = self._match(key)
+            if exchange is None:
+                self.misses += 1
+                raise CassetteMissError("no recorded exchange for " + key.replace("\n", " "))
+            self.replayed += 1
+            content = UUID_PATTERN.sub(lambda m: self._to_replayed.get(m.group(0), m.group(0)),
+                                       exchange["response"])
+        if self.time_scale:
+            time.sleep(exchange["elapsed"] * self.time_scale)
+        response = requests.Response()
+        response.status_code = exchange["status"]
+        if exchange["content_type"] is not None:
+            response.headers["Content-Type"] = exchange["content_type"]
+        response._content = content.encode()
+        response.encoding = "utf-8"
+        response.url = url
+        return response
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.request("POST", url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request("PUT", url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def unused(self):
+        # recorded exchanges that were not replayed, e.g. because the client polled less often
+        with self._lock:
+            return sum(1 for exchanges in self._exact.values() for exchange in exchanges if not exchange["used"])
+
+    def snapshot(self):
+        return {
+            "replayed": self.replayed,
+            "repeated": self.repeated,
+            "learned_ids": self.learned,
+            "misses": self.misses,
+            "unused": self.unused()
+        }
+
+    def close(self):
+        pass
@@ -0,0 +1,105 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+from icecream import ic
+
+import codec
+from common import CONTEXT, ManagementApiError, checked_body, http_client, as_list, create_query_spec, \
+    create_criterion
+
+# upper bound for the pages of one catalog, against providers whose paging never ends
+MAX_PAGES = 10000
+
+
+def offers(dataset):
+    # the offers of a dataset, always as a list
+    return as_list(dataset.get("odrl:hasPolicy"))
+
+
+def fetch_catalog_page(provider_url, connector_management_url, edc_headers, offset, limit, filter_expression=None,
+                       client=None):
+    catalog_request_data = {
+        "@context": CONTEXT,
+        "counterPartyAddress": provider_url,
+        "protocol": "dataspace-protocol-http",
+        "querySpec": create_query_spec(offset, limit, filter_expression)
+    }
+    response = http_client(client).post(connector_management_url + "v2/catalog/request",
+                                        headers=edc_headers,
+                                        data=codec.dumps(catalog_request_data))
+    catalog = checked_body(response, "catalog request to " + provider_url)
+    # as returned by the provider, entries that are no dataset objects still count for the page size
+    return as_list(catalog.get("dcat:dataset"))
+
+
+def iter_catalog(provider_url, connector_management_url, edc_headers, page_size=100, filter_expression=None,
+                 max_datasets=None, verbose=False, client=None, max_pages=MAX_PAGES):
+    """
+    Yields the datasets of a provider catalog one at a time, always as dicts, requesting page_size datasets per
+    catalog request via querySpec offset/limit. Only one page is held in memory at a time. filter_expression is a
+    list of criteria (see common.create_criterion) evaluated by the provider.
+    Providers that ignore offset/limit are detected by a page longer than page_size or a page starting with the
+    same dataset as the previous one, the catalog then ends after that page. More than max_pages pages raise
+    ManagementApiError.
+    """
+    offset = 0
+    yielded = 0
+    previous_first_id = None
+    for _ in range(max_pages):
+        page = fetch_catalog_page(provider_url, connector_management_url, edc_headers, offset, page_size,
+                                  filter_expression, client)
+        if verbose:
+            ic(provider_url, offset, len(page))
+        first_id = page[0].get("@id") if page and isinstance(page[0], dict) else None
+        if offset and first_id is not None and first_id == previous_first_id:
+            # the same page again, offset is not applied
+            return
+        for dataset in page:
+            if not isinstance(dataset, dict):
+                continue
+            yield dataset
+            yielded += 1
+            if max_datasets is not None and yielded >= max_datasets:
+                return
+        if len(page) != page_size:
+            # a short page ends the catalog, a longer one means limit is not applied and it was the whole catalog
+            return
+        previous_first_id = first_id
+        offset += page_size
+    raise ManagementApiError("catalog of " + provider_url + " has more than " + str(max_pages) + " pages of " +
+                             str(page_size) + " datasets")
+
+
+def iter_offers(provider_url, connector_management_url, edc_headers, page_size=100, filter_expression=None,
+                verbose=False, client=None):
+    """
+    Yields (asset id, offer) pairs for every offer in a provider catalog.
+    """
+    for dataset in iter_catalog(provider_url, connector_management_url, edc_headers, page_size, filter_expression,
+                                verbose=verbose, client=client):
+        for offer in offers(dataset):
+            yield dataset.get("@id"), offer
+
+
+def find_dataset(provider_url, connector_management_url, edc_headers, asset_id, client=None):
+    """
+    Looks up a single dataset by asset id with a server-side filter instead of scanning the whole catalog.
+    """
+    for dataset in iter_catalog(provider_url, connector_management_url, edc_headers, page_size=1,
+                                filter_expression=[create_criterion("https://w3id.org/edc/v0.0.1/ns/id", "=",
+                                                                    asset_id)],
+                                max_datasets=1, client=client):
+        return dataset
+    return None
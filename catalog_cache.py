@@ -0,0 +1,108 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class CatalogCache:
+    """
+    TTL and size bounded LRU cache for catalog responses, keyed by (consumer management url, provider dsp url,
+    query spec).
+
+    Concurrent misses for the same key share a single catalog request. Cached datasets are shared between callers
+    and must be treated as read-only. Call invalidate() after creating assets or contract definitions on a provider
+    so the next query sees them. Requests still in flight when invalidate() is called are not cached, lookups after
+    it start a new request instead of waiting for them.
+    """
+
+    def __init__(self, ttl=30.0, max_entries=128):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # lookups that waited for a catalog request already in flight for the same key
+        self.coalesced = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # key -> future of the request in flight, its identity is the generation of the load
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(connector_management_url, provider_url, query_spec=None):
+        return connector_management_url, provider_url, json.dumps(query_spec, sort_keys=True)
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = Future()
+                self._loading[key] = future
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                if self._loading.get(key) is future:
+                    del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            # a load that invalidate() dropped started before the change and must not be stored
+            if self._loading.get(key) is future:
+                del self._loading[key]
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(value)
+        return value
+
+    def invalidate(self, provider_url=None, connector_management_url=None):
+        # without arguments the whole cache is cleared
+        with self._lock:
+            for store in (self._entries, self._loading):
+                for key in list(store):
+                    if (provider_url is None or key[1] == provider_url) and \
+                            (connector_management_url is None or key[0] == connector_management_url):
+                        del store[key]
+
+    def clear(self):
+        self.invalidate()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
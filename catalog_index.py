@@ -0,0 +1,241 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from icecream import ic
+
+from catalog import iter_catalog, offers
+from client import EdcClient
+from policy_index import normalize_policy
+from provisioning import run_bulk
+
+EDC_NAMESPACE = "https://w3id.org/edc/v0.0.1/ns/"
+# dataset keys that are not asset properties
+_STRUCTURAL_KEYS = ("odrl:hasPolicy", "dcat:distribution")
+
+
+def property_name(key):
+    # "edc:name" and "https://w3id.org/edc/v0.0.1/ns/name" are both indexed as "name"
+    if key.startswith(EDC_NAMESPACE):
+        return key[len(EDC_NAMESPACE):]
+    if key.startswith("edc:"):
+        return key[len("edc:"):]
+    return key
+
+
+class IndexedDataset:
+    """
+    Compact form of a catalog dataset: its provider, asset id, asset properties and offers.
+    """
+
+    __slots__ = ("provider", "asset_id", "properties", "offers", "digest")
+
+    def __init__(self, provider, dataset):
+        self.provider = provider
+        self.asset_id = dataset.get("@id")
+        self.properties = {property_name(key): value for key, value in dataset.items()
+                           if not key.startswith("@") and key not in _STRUCTURAL_KEYS}
+        self.offers = offers(dataset)
+        # offer ids contain a random part that changes with every catalog request, they are not part of the digest
+        self.digest = hashlib.sha256(json.dumps([self.properties, [normalize_policy(offer) for offer in self.offers]],
+                                                sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+    def indexed_properties(self):
+        # unique (name, value) pairs with scalar values, lists contribute every scalar item
+        pairs = set()
+        for name, value in self.properties.items():
+            for item in value if isinstance(value, list) else (value,):
+                if isinstance(item, (str, int, float, bool)):
+                    pairs.add((name, item))
+        return pairs
+
+
+class CatalogIndex:
+    """
+    Local index of the datasets and offers of many providers, keyed by (provider, asset id), asset id and
+    (property name, value), so offers can be looked up without catalog requests or scanning lists.
+
+    update() replaces the datasets of one provider and only touches entries whose properties or offers changed.
+    All lookups are dict lookups, entries are shared and must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._datasets = {}
+        self._by_asset = {}
+        self._by_property = {}
+        self._by_provider = {}
+        self._lock = threading.Lock()
+
+    def update(self, provider, datasets):
+        """
+        Makes datasets the complete catalog of provider, returns (added, changed, removed) counts.
+        """
+        added = changed = 0
+        seen = set()
+        with self._lock:
+            known = self._by_provider.setdefault(provider, set())
+            for dataset in datasets:
+                entry = IndexedDataset(provider, dataset)
+                if entry.asset_id is None:
+                    continue
+                seen.add(entry.asset_id)
+                current = self._datasets.get((provider, entry.asset_id))
+                if current is not None:
+                    if current.digest == entry.digest:
+                        continue
+                    self._remove(current)
+                    changed += 1
+                else:
+                    added += 1
+                self._add(entry)
+            removed = known - seen
+            for asset_id in removed:
+                self._remove(self._datasets[(provider, asset_id)])
+        return added, changed, len(removed)
+
+    def _add(self, entry):
+        self._datasets[(entry.provider, entry.asset_id)] = entry
+        self._by_provider.setdefault(entry.provider, set()).add(entry.asset_id)
+        self._by_asset.setdefault(entry.asset_id, {})[entry.provider] = entry
+        for key in entry.indexed_properties():
+            self._by_property.setdefault(key, {})[(entry.provider, entry.asset_id)] = entry
+
+    def _remove(self, entry):
+        del self._datasets[(entry.provider, entry.asset_id)]
+        self._by_provider[entry.provider].discard(entry.asset_id)
+        providers = self._by_asset[entry.asset_id]
+        del providers[entry.provider]
+        if not providers:
+            del self._by_asset[entry.asset_id]
+        for key in entry.indexed_properties():
+            entries = self._by_property.get(key)
+            if entries is None:
+                continue
+            entries.pop((entry.provider, entry.asset_id), None)
+            if not entries:
+                self._by_property.pop(key, None)
+
+    def remove_provider(self, provider):
+        with self._lock:
+            for asset_id in list(self._by_provider.pop(provider, ())):
+                self._remove(self._datasets[(provider, asset_id)])
+
+    def get(self, provider, asset_id):
+        with self._lock:
+            return self._datasets.get((provider, asset_id))
+
+    def offer(self, provider, asset_id):
+        # the first offer for the asset, ready to be passed to common.negotiate_offer
+        entry = self.get(provider, asset_id)
+        return entry.offers[0] if entry is not None and entry.offers else None
+
+    def providers_of(self, asset_id):
+        with self._lock:
+            return list(self._by_asset.get(asset_id, {}))
+
+    def find(self, name, value, provider=None):
+        # entries with the property value, e.g. find("contenttype", "application/json")
+        with self._lock:
+            entries = list(self._by_property.get((property_name(name), value), {}).values())
+        if provider is not None:
+            return [entry for entry in entries if entry.provider == provider]
+        return entries
+
+    def datasets(self, provider):
+        with self._lock:
+            return [self._datasets[(provider, asset_id)] for asset_id in self._by_provider.get(provider, ())]
+
+    def providers(self):
+        with self._lock:
+            return list(self._by_provider)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._datasets)
+
+
+class CatalogCrawler:
+    """
+    Fills a CatalogIndex from the catalogs of many providers (DSP URLs), requesting workers catalogs at the same
+    time through the consumer connector. crawl() fetches all given providers, refresh_due() only those whose last
+    successful crawl is older than refresh_interval seconds, or that failed or were never crawled. The catalog
+    protocol has no change feed, so a refresh fetches the whole catalog of a provider, but only changed datasets are
+    re-indexed. A provider that can't be reached keeps its last known datasets.
+    """
+
+    def __init__(self, connector_management_url, edc_headers, providers=(), index=None, workers=8,
+                 refresh_interval=300.0, page_size=100, verbose=False, client=None):
+        self.connector_management_url = connector_management_url
+        self.edc_headers = edc_headers
+        self.providers = list(providers)
+        self.index = index if index is not None else CatalogIndex()
+        self.workers = workers
+        self.refresh_interval = refresh_interval
+        self.page_size = page_size
+        self.verbose = verbose
+        self.client = client if client is not None else EdcClient(pool_size=workers)
+        self.crawled_at = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def crawl_provider(self, provider):
+        datasets = list(iter_catalog(provider, self.connector_management_url, self.edc_headers, self.page_size,
+                                     client=self.client))
+        added, changed, removed = self.index.update(provider, datasets)
+        with self._lock:
+            self.crawled_at[provider] = time.monotonic()
+            self.errors.pop(provider, None)
+        if self.verbose:
+            ic(provider, len(datasets), added, changed, removed)
+        return added, changed, removed
+
+    def crawl(self, providers=None):
+        """
+        Crawls the given providers (all by default) concurrently, returns a provisioning.BulkResult with
+        (provider, (added, changed, removed)) successes and (provider, exception) failures.
+        """
+        result = run_bulk(self.providers if providers is None else providers, self.crawl_provider, self.workers)
+        with self._lock:
+            for provider, error in result.failed:
+                self.errors[provider] = error
+        if self.verbose:
+            for provider, error in result.failed:
+                ic(provider, error)
+        return result
+
+    def due(self):
+        now = time.monotonic()
+        with self._lock:
+            return [provider for provider in self.providers
+                    if now - self.crawled_at.get(provider, float("-inf")) >= self.refresh_interval]
+
+    def refresh_due(self):
+        return self.crawl(self.due())
+
+    def add_provider(self, provider):
+        if provider not in self.providers:
+            self.providers.append(provider)
+
+    def remove_provider(self, provider):
+        if provider in self.providers:
+            self.providers.remove(provider)
+        with self._lock:
+            self.crawled_at.pop(provider, None)
+            self.errors.pop(provider, None)
+        self.index.remove_provider(provider)
@@ -0,0 +1,150 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CallStats:
+    """
+    Counts requests and their wall time so pooled and unpooled runs can be compared.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.total_seconds = 0.0
+
+    def record(self, elapsed):
+        with self._lock:
+            self.calls += 1
+            self.total_seconds += elapsed
+
+    @property
+    def mean_seconds(self):
+        return self.total_seconds / self.calls if self.calls else 0.0
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.total_seconds = 0.0
+
+
+class EdcClient:
+    """
+    HTTP client for the connector management APIs.
+
+    Owns one requests.Session per connector base URL (scheme://host:port), so consecutive calls against the same
+    connector reuse open keep-alive connections. With pooled=False every call goes through a fresh connection,
+    which is how the module-level requests.post/requests.get calls in common.py behave.
+    The client exposes post/get with the same signature as the requests module, so it can be passed to any helper
+    in common.py via the client argument or installed globally via common.set_default_client.
+    With an admission.AdmissionController as admission, requests wait for a slot and token of their connector.
+    With a resilience.Resilience as resilience, failed requests are retried and connectors that keep failing are
+    given time to recover (circuit breaker), every retry passes admission again.
+    """
+
+    def __init__(self, pool_size=10, keep_alive=True, connect_timeout=5.0, read_timeout=30.0, pooled=True,
+                 admission=None, resilience=None):
+        self.pool_size = pool_size
+        self.admission = admission
+        self.resilience = resilience
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+        self.pooled = pooled
+        self.stats = CallStats()
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def base_url(url):
+        parts = urlsplit(url)
+        return parts.scheme + "://" + parts.netloc
+
+    def session_for(self, url):
+        key = self.base_url(url)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+                session.mount(key + "/", adapter)
+                if not self.keep_alive:
+                    session.headers["Connection"] = "close"
+                self._sessions[key] = session
+            return session
+
+    def request(self, method, url, **kwargs):
+        if self.resilience is not None:
+            return self.resilience.send(method, url, kwargs.get("data"), lambda: self._admitted(method, url, **kwargs))
+        return self._admitted(method, url, **kwargs)
+
+    def _admitted(self, method, url, **kwargs):
+        if self.admission is not None:
+            return self.admission.send(method, url, lambda: self._send(method, url, **kwargs))
+        return self._send(method, url, **kwargs)
+
+    def _send(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            if self.pooled:
+                return self.session_for(url).request(method, url, **kwargs)
+            return requests.request(method, url, **kwargs)
+        finally:
+            self.stats.record(time.perf_counter() - start)
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.request("POST", url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request("PUT", url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def connections_opened(self):
+        # number of TCP connections urllib3 had to establish so far, only tracked for pooled sessions
+        opened = 0
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            for adapter in session.adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is not None:
+                        opened += pool.num_connections
+        return opened
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
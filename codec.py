@@ -0,0 +1,66 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# name -> (dumps, loads), dumps may return str or bytes since both can be sent as request body
+BACKENDS = {
+    "json": (json.dumps, json.loads)
+}
+if orjson is not None:
+    BACKENDS["orjson"] = (orjson.dumps, orjson.loads)
+
+_backend = "json"
+_dumps, _loads = BACKENDS["json"]
+
+
+def set_backend(backend):
+    """
+    Selects the JSON encoder/decoder used for request and response bodies: a name from BACKENDS ("json" or,
+    if installed, "orjson") or a (dumps, loads) pair.
+    """
+    global _backend, _dumps, _loads
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError("unknown or not installed JSON backend " + backend + ", available: " +
+                             ", ".join(BACKENDS))
+        _backend, (_dumps, _loads) = backend, BACKENDS[backend]
+    else:
+        _backend, (_dumps, _loads) = "custom", backend
+
+
+def backend():
+    return _backend
+
+
+def dumps(value):
+    return _dumps(value)
+
+
+def loads(data):
+    return _loads(data)
+
+
+def decode(response):
+    # the body of a response parsed once from the raw bytes, None for empty bodies (e.g. 204)
+    content = response.content
+    if not content:
+        return None
+    return _loads(content)
@@ -13,13 +13,17 @@
   See the License for the specific language governing permissions and
   limitations under the License.
 """
-import time
-
 import requests
 from icecream import ic
-import json
 import uuid
 
+import codec
+import instrumentation
+from instrumentation import instrumented
+
+from polling import poll_until, NEGOTIATION_DONE_STATES, NEGOTIATION_FAILED_STATES, TRANSFER_DONE_STATES, \
+    TRANSFER_FAILED_STATES
+
 
 CONTEXT = {
     "@vocab": "https://w3id.org/edc/v0.0.1/ns/",
@@ -37,8 +41,63 @@ edc2_headers = {
     'X-API-Key': '5678'
 }
 
+# client used by the helpers below if none is passed explicitly, None falls back to the plain requests module
+_default_client = None
+
+
+def set_default_client(client):
+    global _default_client
+    _default_client = client
+
+
+def http_client(client):
+    if client is None:
+        client = _default_client if _default_client is not None else requests
+    # records status code and payload sizes on the current span if instrumentation is enabled
+    return instrumentation.wrap_client(client)
+
+
+def log_enabled(verbose):
+    # payloads are only formatted if they are going to be printed
+    return verbose and ic.enabled
+
 
-def create_dataplane(transfer_url, public_api_url, connector_management_url, edc_headers, verbose=True):
+class ManagementApiError(RuntimeError):
+    """
+    A management API request was answered with an error status or a body that is not the expected JSON object.
+    """
+
+    def __init__(self, message, status_code=None, body=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+def checked_body(response, what):
+    # the decoded JSON object of a successful response, raises instead of a KeyError on error bodies
+    if response.status_code >= 400:
+        raise ManagementApiError(what + " failed with " + str(response.status_code) + ": " + response.text,
+                                 response.status_code, response.text)
+    try:
+        body = codec.decode(response)
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        raise ManagementApiError(what + " returned no JSON object: " + response.text, response.status_code,
+                                 response.text)
+    return body
+
+
+def _status_and_body(response):
+    # error pages of proxies in front of the connector are not JSON, they are returned as text
+    try:
+        return response.status_code, codec.decode(response)
+    except ValueError:
+        return response.status_code, response.text
+
+
+@instrumented("create_dataplane")
+def create_dataplane(transfer_url, public_api_url, connector_management_url, edc_headers, verbose=True, client=None):
     provider_dp_instance_data = {
         "edctype": "dataspaceconnector:dataplaneinstance",
         "id": "http-pull-provider-dataplane",
@@ -49,11 +108,12 @@ def create_dataplane(transfer_url, public_api_url, connector_management_url, edc
             "publicApiUrl": public_api_url
         }
     }
-    ic(provider_dp_instance_data)
-    response = requests.post(connector_management_url + "instances",
-                             headers=edc_headers,
-                             data=json.dumps(provider_dp_instance_data))
-    if verbose:
+    if log_enabled(verbose):
+        ic(provider_dp_instance_data)
+    response = http_client(client).post(connector_management_url + "instances",
+                                        headers=edc_headers,
+                                        data=codec.dumps(provider_dp_instance_data))
+    if log_enabled(verbose):
         ic(response.status_code, response.text)
 
 
@@ -94,9 +154,8 @@ def create_s3_dataaddress_destination(storage, bucket_name, dest_path, key_name=
     }
 
 
-def create_asset(asset_id, asset_name, asset_description, asset_version, asset_contenttype, data_address,
-                 connector_management_url, edc_headers, verbose=True):
-    asset_data = {
+def create_asset_data(asset_id, asset_name, asset_description, asset_version, asset_contenttype, data_address):
+    return {
         "@context": CONTEXT,
         "@id": asset_id,
         "properties": {
@@ -107,84 +166,206 @@ def create_asset(asset_id, asset_name, asset_description, asset_version, asset_c
         },
         "dataAddress": data_address
     }
-    ic(asset_data)
 
-    response = requests.post(connector_management_url + "v3/assets",
-                             headers=edc_headers,
-                             data=json.dumps(asset_data))
-    if verbose:
+
+def create_asset(asset_id, asset_name, asset_description, asset_version, asset_contenttype, data_address,
+                 connector_management_url, edc_headers, verbose=True, client=None):
+    asset_data = create_asset_data(asset_id, asset_name, asset_description, asset_version, asset_contenttype,
+                                   data_address)
+    return create_asset_from_data(asset_data, connector_management_url, edc_headers, verbose, client)
+
+
+@instrumented("create_asset")
+def create_asset_from_data(asset_data, connector_management_url, edc_headers, verbose=True, client=None):
+    # asset_data is a complete asset body as built by create_asset_data, the context is added if it is missing
+    if "@context" not in asset_data:
+        asset_data = dict(asset_data, **{"@context": CONTEXT})
+    if log_enabled(verbose):
+        ic(asset_data)
+
+    response = http_client(client).post(connector_management_url + "v3/assets",
+                                        headers=edc_headers,
+                                        data=codec.dumps(asset_data))
+    body = checked_body(response, "creating asset " + str(asset_data.get("@id")))
+    if log_enabled(verbose):
         ic(response.status_code)
-        ic(json.loads(response.text))
+        ic(body)
     # extract asset id from response
-    return json.loads(response.text)["@id"]
+    return body["@id"]
 
 
-def create_policy(policy_id, connector_management_url, edc_headers, verbose=True):
-    policy_data = {
-        "@context": CONTEXT,
-        "@id": policy_id,
-        "policy": {
-            "@type": "set",
-            "odrl:permission": [],
-            "odrl:prohibition": [],
-            "odrl:obligation": []
-        }
+@instrumented("update_asset")
+def update_asset(asset_data, connector_management_url, edc_headers, verbose=True, client=None):
+    if log_enabled(verbose):
+        ic(asset_data)
+    response = http_client(client).put(connector_management_url + "v3/assets",
+                                       headers=edc_headers,
+                                       data=codec.dumps(asset_data))
+    if log_enabled(verbose):
+        ic(response.status_code)
+    if response.status_code >= 400:
+        raise ManagementApiError("updating asset " + asset_data["@id"] + " failed with " +
+                                 str(response.status_code) + ": " + response.text, response.status_code,
+                                 response.text)
+
+
+@instrumented("delete_asset")
+def delete_asset(asset_id, connector_management_url, edc_headers, verbose=True, client=None):
+    response = http_client(client).delete(connector_management_url + "v3/assets/" + asset_id,
+                                          headers=edc_headers)
+    if log_enabled(verbose):
+        ic(response.status_code)
+    if response.status_code >= 400:
+        raise ManagementApiError("deleting asset " + asset_id + " failed with " + str(response.status_code) +
+                                 ": " + response.text, response.status_code, response.text)
+
+
+def create_set_policy():
+    return {
+        "@type": "set",
+        "odrl:permission": [],
+        "odrl:prohibition": [],
+        "odrl:obligation": []
     }
 
-    ic(policy_data)
 
-    response = requests.post(connector_management_url + "v2/policydefinitions",
-                             headers=edc_headers,
-                             data=json.dumps(policy_data))
-    if verbose:
-        ic(response.status_code, json.loads(response.text))
-    return json.loads(response.text)["@id"]
+@instrumented("create_policy")
+def create_policy(policy_id, connector_management_url, edc_headers, verbose=True, client=None, policy=None,
+                  index=None):
+    if policy is None:
+        policy = create_set_policy()
+    if index is not None:
+        # reuse an existing policy definition with the same content
+        existing_id = index.find(policy, connector_management_url, edc_headers, client)
+        if existing_id is not None:
+            if log_enabled(verbose):
+                ic("Reusing policy definition", existing_id)
+            return existing_id
 
+    policy_data = {
+        "@context": CONTEXT,
+        "@id": policy_id,
+        "policy": policy
+    }
 
-def create_contract_definition(access_policy_id, contract_policy_id, asset_id, connector_management_url, edc_headers, verbose=True):
+    if log_enabled(verbose):
+        ic(policy_data)
+
+    response = http_client(client).post(connector_management_url + "v2/policydefinitions",
+                                        headers=edc_headers,
+                                        data=codec.dumps(policy_data))
+    body = checked_body(response, "creating policy " + policy_id)
+    if log_enabled(verbose):
+        ic(response.status_code, body)
+    created_id = body["@id"]
+    if index is not None:
+        index.add(policy, created_id, connector_management_url)
+    return created_id
+
+
+def create_contract_definition(access_policy_id, contract_policy_id, asset_id, connector_management_url, edc_headers, verbose=True, client=None,
+                               contract_definition_id=None):
+    return create_selector_contract_definition(access_policy_id, contract_policy_id,
+                                               [create_criterion("https://w3id.org/edc/v0.0.1/ns/id", "=", asset_id)],
+                                               connector_management_url, edc_headers, verbose, client,
+                                               contract_definition_id)
+
+
+def create_grouped_contract_definition(access_policy_id, contract_policy_id, asset_ids, connector_management_url,
+                                       edc_headers, verbose=True, client=None, contract_definition_id=None):
+    # one contract definition for many assets sharing the same policies
+    return create_selector_contract_definition(access_policy_id, contract_policy_id,
+                                               [create_criterion("https://w3id.org/edc/v0.0.1/ns/id", "in",
+                                                                 list(asset_ids))],
+                                               connector_management_url, edc_headers, verbose, client,
+                                               contract_definition_id)
+
+
+@instrumented("create_contract_definition")
+def create_selector_contract_definition(access_policy_id, contract_policy_id, assets_selector,
+                                        connector_management_url, edc_headers, verbose=True, client=None,
+                                        contract_definition_id=None):
     contract_definition_data = {
         "@context": CONTEXT,
-        "@id": str(uuid.uuid4()),
+        "@id": contract_definition_id or str(uuid.uuid4()),
         "accessPolicyId": access_policy_id,
         "contractPolicyId": contract_policy_id,
-        "assetsSelector": [
-            {
-                "operandLeft": "https://w3id.org/edc/v0.0.1/ns/id",
-                "operator": "=",
-                "operandRight": asset_id
-            }
-        ]
+        "assetsSelector": assets_selector
     }
 
-    ic(contract_definition_data)
+    if log_enabled(verbose):
+        ic(contract_definition_data)
+
+    response = http_client(client).post(connector_management_url + "v2/contractdefinitions",
+                                        headers=edc_headers,
+                                        data=codec.dumps(contract_definition_data))
+    body = checked_body(response, "creating contract definition " + contract_definition_data["@id"])
+    if log_enabled(verbose):
+        ic(response.status_code, body)
+    return body["@id"]
 
-    response = requests.post(connector_management_url + "v2/contractdefinitions",
-                             headers=edc_headers,
-                             data=json.dumps(contract_definition_data))
-    if verbose:
-        ic(response.status_code, json.loads(response.text))
 
+@instrumented("delete_contract_definition")
+def delete_contract_definition(contract_definition_id, connector_management_url, edc_headers, verbose=True,
+                               client=None):
+    response = http_client(client).delete(connector_management_url + "v2/contractdefinitions/" +
+                                          contract_definition_id, headers=edc_headers)
+    if log_enabled(verbose):
+        ic(response.status_code)
+    return response.status_code
+
+
+@instrumented("query_catalog")
+def query_catalog(provider_url, connector_management_url, edc_headers, verbose=True, client=None, query_spec=None,
+                  cache=None):
+    if cache is not None:
+        return cache.get_or_load(cache.key(connector_management_url, provider_url, query_spec),
+                                 lambda: _request_catalog(provider_url, connector_management_url, edc_headers,
+                                                          verbose, client, query_spec))
+    return _request_catalog(provider_url, connector_management_url, edc_headers, verbose, client, query_spec)
 
-def query_catalog(provider_url, connector_management_url, edc_headers, verbose=True):
+
+def _request_catalog(provider_url, connector_management_url, edc_headers, verbose, client, query_spec):
     catalog_request_data = {
         "@context": CONTEXT,
         "counterPartyAddress": provider_url,
         "protocol": "dataspace-protocol-http"
     }
+    if query_spec is not None:
+        catalog_request_data["querySpec"] = query_spec
+
+    if log_enabled(verbose):
+        ic(catalog_request_data)
 
-    ic(catalog_request_data)
+    response = http_client(client).post(connector_management_url + "v2/catalog/request",
+                                        headers=edc_headers,
+                                        data=codec.dumps(catalog_request_data))
+    body = checked_body(response, "catalog request to " + provider_url)
+    if log_enabled(verbose):
+        ic(response.status_code, body)
 
-    response = requests.post(connector_management_url + "v2/catalog/request",
-                             headers=edc_headers,
-                             data=json.dumps(catalog_request_data))
-    if verbose:
-        ic(response.status_code, json.loads(response.text))
+    return body.get("dcat:dataset", [])
 
-    return json.loads(response.text)["dcat:dataset"]
 
+def as_list(value):
+    # JSON-LD compaction returns a single dict if there is only one element, otherwise a list
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
 
+
+def find_offer(datasets, asset_id=None):
+    for dataset in as_list(datasets):
+        if asset_id is None or dataset.get("@id") == asset_id or dataset.get("id") == asset_id:
+            return dataset
+    return None
+
+
+@instrumented("negotiate_offer")
 def negotiate_offer(connector_id, consumer_id, provider_id, connector_address, policy,
-                    connector_management_url, edc_headers, verbose=True):
+                    connector_management_url, edc_headers, verbose=True, client=None, callback_addresses=None):
     consumer_offer_data = {
         "@context": CONTEXT,
         "@type": "NegotiationInitiateRequestDto",
@@ -195,39 +376,131 @@ def negotiate_offer(connector_id, consumer_id, provider_id, connector_address, p
         "protocol": "dataspace-protocol-http",
         "policy": policy
     }
+    if callback_addresses:
+        consumer_offer_data["callbackAddresses"] = callback_addresses
 
-    ic(consumer_offer_data)
+    if log_enabled(verbose):
+        ic(consumer_offer_data)
 
-    response = requests.post(connector_management_url + "v2/contractnegotiations",
-                             headers=edc_headers,
-                             data=json.dumps(consumer_offer_data))
-    if verbose:
-        ic(response.status_code, json.loads(response.text))
+    response = http_client(client).post(connector_management_url + "v2/contractnegotiations",
+                                        headers=edc_headers,
+                                        data=codec.dumps(consumer_offer_data))
+    body = checked_body(response, "negotiating offer with " + connector_address)
+    if log_enabled(verbose):
+        ic(response.status_code, body)
 
     # extract negotiation id
-    return json.loads(response.text)["@id"]
+    return body["@id"]
+
+
+@instrumented("get_negotiation")
+def get_negotiation(connector_management_url, negotiation_id, edc_headers, client=None):
+    response = http_client(client).get(connector_management_url + "v2/contractnegotiations/" + negotiation_id,
+                                       headers=edc_headers)
+    return _status_and_body(response)
+
+
+def create_query_spec(offset=0, limit=50, filter_expression=None, sort_field=None, sort_order="ASC"):
+    query_spec = {
+        "@context": CONTEXT,
+        "@type": "QuerySpec",
+        "offset": offset,
+        "limit": limit,
+        "filterExpression": filter_expression or []
+    }
+    if sort_field is not None:
+        query_spec["sortField"] = sort_field
+        query_spec["sortOrder"] = sort_order
+    return query_spec
+
+
+def create_criterion(operand_left, operator, operand_right):
+    return {
+        "operandLeft": operand_left,
+        "operator": operator,
+        "operandRight": operand_right
+    }
+
 
+def _query(path, connector_management_url, edc_headers, query_spec, client):
+    response = http_client(client).post(connector_management_url + path,
+                                        headers=edc_headers,
+                                        data=codec.dumps(query_spec))
+    return _status_and_body(response)
 
-def poll_negotiation_until_finalized(connector_management_url, negotiation_id, edc_headers, verbose=True):
-    state = ""
 
-    while state != "FINALIZED":
-        ic("Requesting status of negotiation")
-        response = requests.get(connector_management_url + "v2/contractnegotiations/" + negotiation_id,
-                                headers=edc_headers)
-        state = json.loads(response.text)["state"]
-        if verbose:
-            ic(state)
-        time.sleep(1)
-    if verbose:
-        ic(response.status_code, json.loads(response.text))
-    return json.loads(response.text)["contractAgreementId"]
+@instrumented("get_policy_definition")
+def get_policy_definition(connector_management_url, policy_id, edc_headers, client=None):
+    response = http_client(client).get(connector_management_url + "v2/policydefinitions/" + policy_id,
+                                       headers=edc_headers)
+    return _status_and_body(response)
 
 
+@instrumented("query_assets")
+def query_assets(connector_management_url, edc_headers, query_spec, client=None):
+    return _query("v3/assets/request", connector_management_url, edc_headers, query_spec, client)
+
+
+@instrumented("query_policy_definitions")
+def query_policy_definitions(connector_management_url, edc_headers, query_spec, client=None):
+    return _query("v2/policydefinitions/request", connector_management_url, edc_headers, query_spec, client)
+
+
+@instrumented("query_negotiations")
+def query_negotiations(connector_management_url, edc_headers, query_spec, client=None):
+    return _query("v2/contractnegotiations/request", connector_management_url, edc_headers, query_spec, client)
+
+
+@instrumented("query_transfer_processes")
+def query_transfer_processes(connector_management_url, edc_headers, query_spec, client=None):
+    return _query("v2/transferprocesses/request", connector_management_url, edc_headers, query_spec, client)
+
+
+@instrumented("get_contract_agreement")
+def get_contract_agreement(connector_management_url, agreement_id, edc_headers, client=None):
+    response = http_client(client).get(connector_management_url + "v2/contractagreements/" + agreement_id,
+                                       headers=edc_headers)
+    return _status_and_body(response)
+
+
+@instrumented("get_agreement_negotiation")
+def get_agreement_negotiation(connector_management_url, agreement_id, edc_headers, client=None):
+    response = http_client(client).get(connector_management_url + "v2/contractagreements/" + agreement_id +
+                                       "/negotiation", headers=edc_headers)
+    return _status_and_body(response)
+
+
+def poll_logger(verbose):
+    def on_poll(status_code, body):
+        if log_enabled(verbose):
+            ic(body.get("state") if isinstance(body, dict) else status_code)
+    return on_poll
+
+
+@instrumented("poll_negotiation_until_finalized")
+def poll_negotiation_until_finalized(connector_management_url, negotiation_id, edc_headers, verbose=True, client=None,
+                                     strategy=None, stats=None):
+    def fetch():
+        if log_enabled(verbose):
+            ic("Requesting status of negotiation")
+        return get_negotiation(connector_management_url, negotiation_id, edc_headers, client)
+
+    status_code, negotiation, polls = poll_until(fetch, "negotiation " + negotiation_id, NEGOTIATION_DONE_STATES,
+                                                 NEGOTIATION_FAILED_STATES, strategy, stats, poll_logger(verbose))
+    instrumentation.annotate(polls=polls)
+    if log_enabled(verbose):
+        ic(status_code, negotiation, polls)
+    return negotiation["contractAgreementId"]
+
+
+@instrumented("initiate_data_transfer")
 def initiate_data_transfer(connector_id, connector_address, agreement_id, asset_id, data_destination,
-                           connector_management_url, edc_headers, verbose=True):
+                           connector_management_url, edc_headers, verbose=True, client=None, callback_addresses=None,
+                           transfer_id=None):
+    # the id is generated here instead of by the connector, so a retried request can't start a second transfer
     transfer_data = {
         "@context": CONTEXT,
+        "@id": transfer_id or str(uuid.uuid4()),
         "@type": "TransferRequestDto",
         "connectorId": connector_id,
         "counterPartyAddress": connector_address,
@@ -236,35 +509,50 @@ def initiate_data_transfer(connector_id, connector_address, agreement_id, asset_
         "protocol": "dataspace-protocol-http",
         "dataDestination": data_destination
     }
-
-    ic(transfer_data)
-
-    response = requests.post(connector_management_url + "v2/transferprocesses",
-                             headers=edc_headers,
-                             data=json.dumps(transfer_data))
-    if verbose:
-        ic(response.status_code, json.loads(response.text))
-    return json.loads(response.text)["@id"]
-
-
-def poll_transfer_until_completed(connector_management_url, transfer_id, edc_headers, verbose=True):
-    state = ""
-
-    while state != "COMPLETED":
-        ic("Requesting status of transfer")
-        response = requests.get(connector_management_url + "v2/transferprocesses/" + transfer_id,
-                                headers=edc_headers)
-        state = json.loads(response.text)["state"]
-        if verbose:
-            ic(state)
-        time.sleep(1)
-
-    if verbose:
-        ic(response.status_code, json.loads(response.text))
-
-def deprovision_s3_token(connector_management_url, transfer_id, edc_headers, verbose=True):
-    ic("Requesting status of transfer")
-    response = requests.post(connector_management_url + "/v2/transferprocesses/" + transfer_id + "/deprovision",
-                            headers=edc_headers)
-    if verbose:
-        ic(response.status_code, json.loads(response.text))
\ No newline at end of file
+    if callback_addresses:
+        transfer_data["callbackAddresses"] = callback_addresses
+
+    if log_enabled(verbose):
+        ic(transfer_data)
+
+    response = http_client(client).post(connector_management_url + "v2/transferprocesses",
+                                        headers=edc_headers,
+                                        data=codec.dumps(transfer_data))
+    body = checked_body(response, "initiating transfer for agreement " + agreement_id)
+    if log_enabled(verbose):
+        ic(response.status_code, body)
+    return body["@id"]
+
+
+@instrumented("get_transfer_process")
+def get_transfer_process(connector_management_url, transfer_id, edc_headers, client=None):
+    response = http_client(client).get(connector_management_url + "v2/transferprocesses/" + transfer_id,
+                                       headers=edc_headers)
+    return _status_and_body(response)
+
+
+@instrumented("poll_transfer_until_completed")
+def poll_transfer_until_completed(connector_management_url, transfer_id, edc_headers, verbose=True, client=None,
+                                  strategy=None, stats=None):
+    def fetch():
+        if log_enabled(verbose):
+            ic("Requesting status of transfer")
+        return get_transfer_process(connector_management_url, transfer_id, edc_headers, client)
+
+    status_code, transfer, polls = poll_until(fetch, "transfer " + transfer_id, TRANSFER_DONE_STATES,
+                                              TRANSFER_FAILED_STATES, strategy, stats, poll_logger(verbose))
+    instrumentation.annotate(polls=polls)
+    if log_enabled(verbose):
+        ic(status_code, transfer, polls)
+
+@instrumented("deprovision_s3_token")
+def deprovision_s3_token(connector_management_url, transfer_id, edc_headers, verbose=True, client=None):
+    if log_enabled(verbose):
+        ic("Requesting deprovisioning of transfer")
+    response = http_client(client).post(connector_management_url + "/v2/transferprocesses/" + transfer_id + "/deprovision",
+                                        headers=edc_headers)
+    if log_enabled(verbose):
+        ic(response.status_code, response.text)
+    if response.status_code >= 400:
+        raise ManagementApiError("deprovisioning transfer " + transfer_id + " failed with " +
+                                 str(response.status_code) + ": " + response.text, response.status_code, response.text)
@@ -0,0 +1,56 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import argparse
+import time
+
+from icecream import ic
+
+from catalog_index import CatalogCrawler
+from common import edc1_headers
+
+"""
+Crawls the catalogs of many providers through the consumer connector into a local index and looks up datasets in it.
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("providers", help="file with one provider DSP URL per line")
+parser.add_argument("--management-url", default="http://localhost:29193/management/")
+parser.add_argument("--workers", type=int, default=8, help="number of catalogs requested at the same time")
+parser.add_argument("--page-size", type=int, default=100)
+parser.add_argument("--find", action="append", default=[], metavar="NAME=VALUE",
+                    help="print the datasets with this property value, can be repeated")
+parser.add_argument("--watch", type=float, metavar="SECONDS", help="keep refreshing the catalogs at this interval")
+args = parser.parse_args()
+
+with open(args.providers) as f:
+    providers = [line.strip() for line in f if line.strip()]
+
+crawler = CatalogCrawler(args.management_url, edc1_headers, providers, workers=args.workers,
+                         refresh_interval=args.watch or 0.0, page_size=args.page_size)
+while True:
+    result = crawler.refresh_due()
+    for provider, (added, changed, removed) in result.succeeded:
+        ic(provider, added, changed, removed)
+    for provider, error in result.failed:
+        ic(provider, error)
+    ic(len(crawler.index), result.elapsed)
+    for query in args.find:
+        name, _, value = query.partition("=")
+        for entry in crawler.index.find(name, value):
+            ic(entry.provider, entry.asset_id, entry.properties)
+    if not args.watch:
+        break
+    time.sleep(args.watch)
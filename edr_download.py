@@ -0,0 +1,226 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import base64
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from icecream import ic
+
+from callbacks import EmbeddedHttpServer, read_body
+from common import create_http_proxy_dataaddress, http_client, initiate_data_transfer
+
+
+def token_expiry(auth_code):
+    # the exp claim of a JWT auth code, None if the code is no JWT or carries no expiry
+    parts = auth_code.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(parts[1] + "=" * (-len(parts[1]) % 4)))
+    except ValueError:
+        return None
+    return claims.get("exp")
+
+
+def edr_key(edr):
+    # EDRs are looked up by the contract agreement they were issued for
+    return (edr.get("properties") or {}).get("cid") or edr.get("id")
+
+
+class EdrCache:
+    """
+    Endpoint data references by contract agreement id, with the expiry taken from the auth code.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._condition = threading.Condition()
+
+    def put(self, edr):
+        with self._condition:
+            self._entries[edr_key(edr)] = (edr, token_expiry(edr.get("authCode", "")))
+            self._condition.notify_all()
+
+    def get(self, key, refresh_margin=0.0):
+        with self._condition:
+            return self._valid(key, refresh_margin)
+
+    def wait(self, key, timeout=60.0, refresh_margin=0.0):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._valid(key, refresh_margin) is not None, timeout):
+                raise TimeoutError("no valid EDR for " + key + " received within " + str(timeout) + " s")
+            return self._valid(key, refresh_margin)
+
+    def _valid(self, key, refresh_margin):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        edr, expires_at = entry
+        if expires_at is not None and expires_at - refresh_margin <= time.time():
+            return None
+        return edr
+
+
+class EdrReceiver(EmbeddedHttpServer):
+    """
+    Receives the EDRs the consumer connector pushes to edc.receiver.http.endpoint and puts them into an EdrCache.
+    Listens on port 4000 like the consumer backend service of the pull sample, so it can replace it.
+    """
+
+    def __init__(self, host="127.0.0.1", port=4000, cache=None, verbose=False):
+        super().__init__(host, port, "/receiver", name="edc-edr-receiver")
+        self.cache = cache if cache is not None else EdrCache()
+        self.verbose = verbose
+
+    async def handle(self, method, path, headers, reader):
+        body = await read_body(reader, headers)
+        if method != "POST":
+            return 405, b""
+        try:
+            edr = json.loads(body)
+        except ValueError:
+            return 400, b""
+        if self.verbose:
+            ic("Received EDR", edr_key(edr), edr.get("endpoint"))
+        self.cache.put(edr)
+        return 200, b""
+
+
+class EdrSource:
+    """
+    Callable returning a valid EDR for a contract agreement. If the cached EDR is missing or expires within
+    refresh_margin seconds, a new one is requested by starting another pull transfer for the agreement.
+    """
+
+    def __init__(self, cache, connector_id, provider_dsp_url, agreement_id, asset_id, consumer_management_url,
+                 edc_headers, refresh_margin=30.0, timeout=60.0, client=None):
+        self.cache = cache
+        self.connector_id = connector_id
+        self.provider_dsp_url = provider_dsp_url
+        self.agreement_id = agreement_id
+        self.asset_id = asset_id
+        self.consumer_management_url = consumer_management_url
+        self.edc_headers = edc_headers
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.client = client
+        self.refreshes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        edr = self.cache.get(self.agreement_id, self.refresh_margin)
+        if edr is not None:
+            return edr
+        with self._lock:
+            # another thread may have refreshed in the meantime
+            edr = self.cache.get(self.agreement_id, self.refresh_margin)
+            if edr is None:
+                self.refreshes += 1
+                initiate_data_transfer(self.connector_id, self.provider_dsp_url, self.agreement_id, self.asset_id,
+                                       create_http_proxy_dataaddress(), self.consumer_management_url,
+                                       self.edc_headers, verbose=False, client=self.client)
+                edr = self.cache.wait(self.agreement_id, self.timeout, self.refresh_margin)
+            return edr
+
+
+class DownloadResult:
+    def __init__(self, path, size, elapsed, ranged, requests):
+        self.path = path
+        self.size = size
+        self.elapsed = elapsed
+        self.ranged = ranged
+        self.requests = requests
+
+    @property
+    def bytes_per_second(self):
+        return self.size / self.elapsed if self.elapsed else 0.0
+
+
+def _get(edr_source, client, params, extra_headers=None):
+    edr = edr_source()
+    headers = {edr.get("authKey") or "Authorization": edr["authCode"]}
+    headers.update(extra_headers or {})
+    return http_client(client).get(edr["endpoint"], headers=headers, params=params, stream=True)
+
+
+def _write(response, path, offset, chunk_size):
+    written = 0
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        for chunk in response.iter_content(chunk_size):
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def _check_size(path, size, total):
+    if total is not None and size != total:
+        raise IOError("download to " + path + " incomplete: " + str(size) + " of " + str(total) + " bytes written")
+
+
+def download(edr, path, parallel=4, part_size=8 * 1024 * 1024, chunk_size=1024 * 1024, params=None, client=None):
+    """
+    Downloads the data behind an EDR (a dict or an EdrSource) straight to path without holding it in memory.
+
+    The first request asks for the first part_size bytes. If the provider answers with 206 and the payload is
+    larger, the remaining parts are fetched with ranged GETs into the preallocated file, parallel of them at the same
+    time (one after another with parallel=1), otherwise the body is streamed sequentially. Each request takes the
+    current EDR from the source, so expiring tokens are refreshed during long downloads. Raises IOError if fewer
+    bytes than the announced size were written.
+    """
+    edr_source = edr if callable(edr) else (lambda: edr)
+    start = time.perf_counter()
+    open(path, "wb").close()
+
+    probe = _get(edr_source, client, params, {"Range": "bytes=0-" + str(part_size - 1)})
+    if probe.status_code not in (200, 206):
+        raise requests.HTTPError("download failed with " + str(probe.status_code) + ": " + probe.text,
+                                 response=probe)
+    total = None
+    if probe.status_code == 206:
+        total = int(probe.headers.get("Content-Range", "*/0").rsplit("/", 1)[1].replace("*", "0")) or None
+
+    if total is None or total <= part_size:
+        size = _write(probe, path, 0, chunk_size)
+        _check_size(path, size, total)
+        return DownloadResult(path, size, time.perf_counter() - start, False, 1)
+
+    with open(path, "r+b") as f:
+        f.truncate(total)
+
+    def fetch(offset):
+        end = min(offset + part_size, total) - 1
+        response = _get(edr_source, client, params, {"Range": "bytes=" + str(offset) + "-" + str(end)})
+        if response.status_code != 206:
+            response.close()
+            raise requests.HTTPError("ranged request for bytes " + str(offset) + "-" + str(end) + " failed with " +
+                                     str(response.status_code), response=response)
+        return _write(response, path, offset, chunk_size)
+
+    offsets = range(part_size, total, part_size)
+    if parallel <= 1:
+        size = _write(probe, path, 0, chunk_size)
+        size += sum(fetch(offset) for offset in offsets)
+    else:
+        with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="edr-download") as executor:
+            pending = [executor.submit(fetch, offset) for offset in offsets]
+            size = _write(probe, path, 0, chunk_size)
+            size += sum(future.result() for future in pending)
+    _check_size(path, size, total)
+    return DownloadResult(path, size, time.perf_counter() - start, True, 1 + len(offsets))
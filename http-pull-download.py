@@ -0,0 +1,96 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import argparse
+
+from icecream import ic
+
+from client import EdcClient
+from common import create_dataplane, create_asset, create_policy, create_contract_definition, query_catalog, \
+    negotiate_offer, poll_negotiation_until_finalized, find_offer, create_http_dataaddress, edc1_headers, \
+    edc2_headers
+from edr_download import EdrReceiver, EdrSource, download
+
+"""
+HTTP pull flow that also fetches the data: the EDR is received by an embedded receiver on port 4000 (instead of the
+consumer backend service) and the payload is downloaded from the provider's public API straight to disk.
+"""
+
+"""
+Endpoint configuration
+"""
+provider_connector_control_url = "http://localhost:19192/control/"
+provider_connector_public_url = "http://localhost:19291/public/"
+provider_connector_management_url = "http://localhost:19193/management/"
+provider_connector_dsp_url = "http://localhost:19194/protocol"
+
+consumer_connector_control_url = "http://localhost:29192/control/"
+consumer_connector_public_url = "http://localhost:29291/public/"
+consumer_connector_management_url = "http://localhost:29193/management/"
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--source-url", default="https://jsonplaceholder.typicode.com/users")
+parser.add_argument("--output", default="download.bin")
+parser.add_argument("--parallel", type=int, default=4, help="number of parallel ranged requests")
+parser.add_argument("--part-size", type=int, default=8 * 1024 * 1024)
+args = parser.parse_args()
+
+client = EdcClient(pool_size=max(10, args.parallel))
+
+with EdrReceiver(verbose=True) as receiver:
+    """
+    Connector initialization
+    """
+    ic("Preparing provider and consumer connector dataplanes")
+    create_dataplane(provider_connector_control_url + "transfer", provider_connector_public_url,
+                     provider_connector_management_url, edc2_headers, client=client)
+    create_dataplane(consumer_connector_control_url + "transfer", consumer_connector_public_url,
+                     consumer_connector_management_url, edc1_headers, client=client)
+
+    """
+    Create asset, policy and contract definition on the provider
+    """
+    ic("Creating asset, policy and contract definition in provider connector")
+    asset_id = create_asset("assetId", "My Asset", "Description", "v1.2.3", "application/json",
+                            create_http_dataaddress("My Asset", args.source_url),
+                            provider_connector_management_url, edc2_headers, client=client)
+    policy_id = create_policy("aPolicy", provider_connector_management_url, edc2_headers, client=client)
+    create_contract_definition(policy_id, policy_id, asset_id, provider_connector_management_url, edc2_headers,
+                               client=client)
+
+    """
+    Negotiate contract
+    """
+    ic("Query providers catalog and negotiate offer")
+    offering_data = find_offer(query_catalog(provider_connector_dsp_url, consumer_connector_management_url,
+                                             edc1_headers, client=client), asset_id)
+    if offering_data is None:
+        raise LookupError("asset " + asset_id + " not found in catalog of " + provider_connector_dsp_url)
+    negotiation_id = negotiate_offer("provider", "consumer", "provider", provider_connector_dsp_url,
+                                     offering_data["odrl:hasPolicy"], consumer_connector_management_url,
+                                     edc1_headers, client=client)
+    agreement_id = poll_negotiation_until_finalized(consumer_connector_management_url, negotiation_id, edc1_headers,
+                                                    client=client)
+
+    """
+    Start the pull transfer and download the data with the received EDR
+    """
+    ic("Initiate data transfer and wait for the EDR")
+    edr_source = EdrSource(receiver.cache, "provider", provider_connector_dsp_url, agreement_id, asset_id,
+                           consumer_connector_management_url, edc1_headers, client=client)
+
+    ic("Download data")
+    result = download(edr_source, args.output, parallel=args.parallel, part_size=args.part_size, client=client)
+    ic(result.path, result.size, result.ranged, result.requests, result.elapsed, result.bytes_per_second)
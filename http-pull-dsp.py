@@ -13,10 +13,13 @@
   See the License for the specific language governing permissions and
   limitations under the License.
 """
+import argparse
 from icecream import ic
+from cassette import CassetteRecorder
+from client import EdcClient
 from common import create_dataplane, create_asset, create_policy, create_contract_definition, query_catalog, \
     negotiate_offer, poll_negotiation_until_finalized, initiate_data_transfer, poll_transfer_until_completed, \
-    create_http_dataaddress, create_http_proxy_dataaddress, edc1_headers, edc2_headers
+    create_http_dataaddress, create_http_proxy_dataaddress, edc1_headers, edc2_headers, set_default_client
 
 """
 Endpoint configuration
@@ -30,6 +33,15 @@ consumer_connector_control_url = "http://localhost:29192/control/"
 consumer_connector_public_url = "http://localhost:29291/public/"
 consumer_connector_management_url = "http://localhost:29193/management/"
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--record", metavar="CASSETTE", help="record every management API exchange to this cassette")
+args = parser.parse_args()
+
+# all helpers below use the default client, so wrapping it records the whole flow
+recorder = CassetteRecorder(args.record) if args.record else None
+if recorder is not None:
+    set_default_client(recorder.wrap(EdcClient()))
+
 """
 Connector initialization
 """
@@ -120,3 +132,7 @@ poll_transfer_until_completed(consumer_connector_management_url, transfer_id, ed
 
 # at this point we ask the consumer backend service (separate from the connector) for the authentication token
 # and query the public endpoint of the provider with this authorization like a proxy
+
+if recorder is not None:
+    recorder.close()
+    ic(recorder.exchanges, args.record)
@@ -13,10 +13,13 @@
   See the License for the specific language governing permissions and
   limitations under the License.
 """
+import argparse
 from icecream import ic
+from cassette import CassetteRecorder
+from client import EdcClient
 from common import create_asset, create_policy, create_contract_definition, query_catalog, \
     negotiate_offer, poll_negotiation_until_finalized, initiate_data_transfer, poll_transfer_until_completed, \
-    create_http_dataaddress, edc1_headers, edc2_headers, create_dataplane
+    create_http_dataaddress, edc1_headers, edc2_headers, create_dataplane, set_default_client
 
 """
 Endpoint configuration
@@ -31,6 +34,15 @@ consumer_connector_public_url = "http://localhost:29291/public/"
 consumer_connector_management_url = "http://localhost:29193/management/"
 consumer_backend_url = "http://localhost:4000/api/consumer/store"
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--record", metavar="CASSETTE", help="record every management API exchange to this cassette")
+args = parser.parse_args()
+
+# all helpers below use the default client, so wrapping it records the whole flow
+recorder = CassetteRecorder(args.record) if args.record else None
+if recorder is not None:
+    set_default_client(recorder.wrap(EdcClient()))
+
 """
 Connector initialization
 """
@@ -109,4 +121,8 @@ ic("Check transfer status and wait until completed")
 poll_transfer_until_completed(consumer_connector_management_url, transfer_id, edc1_headers)
 
 # at this point we ask the consumer backend service (separate from the connector) for the authentication token
-# and query the public endpoint of the provider with this authorization like a proxy
\ No newline at end of file
+# and query the public endpoint of the provider with this authorization like a proxy
+
+if recorder is not None:
+    recorder.close()
+    ic(recorder.exchanges, args.record)
@@ -0,0 +1,368 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+# recorder the instrumented helpers report to, None disables instrumentation
+_recorder = None
+_current = contextvars.ContextVar("edc_span", default=None)
+_ids = itertools.count(1)
+
+
+def set_recorder(recorder):
+    global _recorder
+    _recorder = recorder
+
+
+def enabled():
+    return _recorder is not None
+
+
+class Span:
+    """
+    One timed operation: duration, the management API requests sent on its behalf (count, last status code,
+    request and response bytes), poll count for the poll helpers and the exception type if it failed.
+    Spans of operations started within another operation carry its id as parent.
+    """
+
+    __slots__ = ("name", "span_id", "parent_id", "start", "duration", "status_code", "requests", "request_bytes",
+                 "response_bytes", "polls", "error", "attributes", "_started", "_token")
+
+    def __init__(self, name, parent_id=None, attributes=None):
+        self.name = name
+        self.span_id = next(_ids)
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.duration = None
+        self.status_code = None
+        self.requests = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.polls = None
+        self.error = None
+        self.attributes = attributes or {}
+        self._started = time.perf_counter()
+        self._token = None
+
+    def record_response(self, url, request_body, response, stream=False):
+        self.requests += 1
+        self.status_code = response.status_code
+        if request_body is not None:
+            self.request_bytes += len(request_body)
+        if stream:
+            # do not consume a streamed body just to measure it
+            self.response_bytes += int(response.headers.get("Content-Length") or 0)
+        else:
+            self.response_bytes += len(response.content)
+        self.attributes.setdefault("connector", urlsplit(url).netloc)
+
+    def annotate(self, **fields):
+        for key, value in fields.items():
+            if key in ("polls", "status_code", "error"):
+                setattr(self, key, value)
+            else:
+                self.attributes[key] = value
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.duration = time.perf_counter() - self._started
+        if exc_type is not None:
+            if self.error is None:
+                self.error = exc_type.__name__
+            if self.polls is None:
+                # PollFailedError and PollTimeoutError carry the number of polls until they gave up
+                self.polls = getattr(exc_val, "polls", None)
+        _current.reset(self._token)
+        recorder = _recorder
+        if recorder is not None:
+            recorder.emit(self)
+
+    def as_dict(self):
+        data = {
+            "name": self.name,
+            "id": self.span_id,
+            "parent": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "status": self.status_code,
+            "requests": self.requests,
+            "requestBytes": self.request_bytes,
+            "responseBytes": self.response_bytes,
+            "polls": self.polls,
+            "error": self.error
+        }
+        data.update(self.attributes)
+        return data
+
+
+class _NoSpan:
+    # stands in for a span while instrumentation is disabled
+
+    def annotate(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **attributes):
+    """
+    Context manager timing the enclosed block as a span, a shared no-op object if instrumentation is disabled.
+    """
+    if _recorder is None:
+        return _NO_SPAN
+    parent = _current.get()
+    return Span(name, parent.span_id if parent is not None else None, attributes)
+
+
+def current_span():
+    return _current.get()
+
+
+def annotate(**fields):
+    # adds fields (e.g. polls=3) to the innermost active span
+    current = _current.get()
+    if current is not None:
+        current.annotate(**fields)
+
+
+def instrumented(name):
+    """
+    Decorator running the function in a span called name. Costs one global lookup while disabled.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _InstrumentedClient:
+    # forwards requests to the real client and records their responses on the current span
+
+    def __init__(self, client, current):
+        self._client = client
+        self._span = current
+
+    def request(self, method, url, **kwargs):
+        response = self._client.request(method, url, **kwargs)
+        self._span.record_response(url, kwargs.get("data"), response, kwargs.get("stream", False))
+        return response
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.request("POST", url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request("PUT", url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+def wrap_client(client):
+    # the client itself if instrumentation is disabled or no span is active
+    if _recorder is None:
+        return client
+    current = _current.get()
+    if current is None:
+        return client
+    return _InstrumentedClient(client, current)
+
+
+class Recorder:
+    """
+    Hands every finished span to the exporters, install it with set_recorder(Recorder(...)).
+    """
+
+    def __init__(self, *exporters):
+        self.exporters = list(exporters)
+
+    def emit(self, finished_span):
+        for exporter in self.exporters:
+            exporter.export(finished_span)
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+
+    def __enter__(self):
+        set_recorder(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if _recorder is self:
+            set_recorder(None)
+        self.close()
+
+
+class JsonLinesExporter:
+    """
+    Appends every span as one JSON object per line to path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def export(self, finished_span):
+        line = json.dumps(finished_span.as_dict()) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class MemoryExporter:
+    """
+    Keeps the finished spans in spans, e.g. to evaluate them at the end of a benchmark.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, finished_span):
+        with self._lock:
+            self.spans.append(finished_span)
+
+    def close(self):
+        pass
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Aggregate:
+    __slots__ = ("buckets", "count", "duration", "requests", "request_bytes", "response_bytes", "polls", "errors",
+                 "status_codes")
+
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.duration = 0.0
+        self.requests = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.polls = 0
+        self.errors = 0
+        self.status_codes = {}
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class PrometheusExporter:
+    """
+    Aggregates spans per operation into Prometheus metrics: a duration histogram, request/byte/poll/error counters
+    and responses by status code. write_textfile() writes them in the text format for the node exporter textfile
+    collector (atomically via rename), it is also called on close if path is set.
+    """
+
+    def __init__(self, path=None, prefix="edc_operation"):
+        self.path = path
+        self.prefix = prefix
+        self._aggregates = {}
+        self._lock = threading.Lock()
+
+    def export(self, finished_span):
+        with self._lock:
+            aggregate = self._aggregates.get(finished_span.name)
+            if aggregate is None:
+                aggregate = self._aggregates[finished_span.name] = _Aggregate()
+            aggregate.count += 1
+            aggregate.duration += finished_span.duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if finished_span.duration <= bound:
+                    aggregate.buckets[i] += 1
+            aggregate.requests += finished_span.requests
+            aggregate.request_bytes += finished_span.request_bytes
+            aggregate.response_bytes += finished_span.response_bytes
+            aggregate.polls += finished_span.polls or 0
+            if finished_span.error is not None or (finished_span.status_code or 0) >= 400:
+                aggregate.errors += 1
+            if finished_span.status_code is not None:
+                aggregate.status_codes[finished_span.status_code] = \
+                    aggregate.status_codes.get(finished_span.status_code, 0) + 1
+
+    def render(self):
+        p = self.prefix
+        with self._lock:
+            aggregates = sorted(self._aggregates.items())
+            lines = ["# HELP " + p + "_duration_seconds Duration of the EDC client operations.",
+                     "# TYPE " + p + "_duration_seconds histogram"]
+            for name, aggregate in aggregates:
+                label = "operation=\"" + _label(name) + "\""
+                for bound, count in zip(DURATION_BUCKETS, aggregate.buckets):
+                    lines.append(p + "_duration_seconds_bucket{" + label + ",le=\"" + repr(bound) + "\"} " +
+                                 str(count))
+                lines.append(p + "_duration_seconds_bucket{" + label + ",le=\"+Inf\"} " + str(aggregate.count))
+                lines.append(p + "_duration_seconds_sum{" + label + "} " + repr(aggregate.duration))
+                lines.append(p + "_duration_seconds_count{" + label + "} " + str(aggregate.count))
+            for metric, attribute, help_text in (
+                    ("requests_total", "requests", "Management API requests sent."),
+                    ("request_bytes_total", "request_bytes", "Bytes of the request bodies sent."),
+                    ("response_bytes_total", "response_bytes", "Bytes of the response bodies received."),
+                    ("polls_total", "polls", "Status requests of the poll helpers."),
+                    ("errors_total", "errors", "Operations that raised or ended with a 4xx/5xx response.")):
+                lines.append("# HELP " + p + "_" + metric + " " + help_text)
+                lines.append("# TYPE " + p + "_" + metric + " counter")
+                for name, aggregate in aggregates:
+                    lines.append(p + "_" + metric + "{operation=\"" + _label(name) + "\"} " +
+                                 str(getattr(aggregate, attribute)))
+            lines.append("# HELP " + p + "_responses_total Operations by status code of their last response.")
+            lines.append("# TYPE " + p + "_responses_total counter")
+            for name, aggregate in aggregates:
+                for code, count in sorted(aggregate.status_codes.items()):
+                    lines.append(p + "_responses_total{operation=\"" + _label(name) + "\",code=\"" + str(code) +
+                                 "\"} " + str(count))
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path=None):
+        path = path or self.path
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(self.render())
+        os.replace(temporary, path)
+
+    def close(self):
+        if self.path is not None:
+            self.write_textfile()
@@ -0,0 +1,139 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import json
+
+from client import EdcClient
+from common import CONTEXT, ManagementApiError, create_asset_from_data, create_query_spec, delete_asset, query_assets, \
+    update_asset
+from provisioning import BulkResult, run_bulk
+
+_NAMESPACES = ("https://w3id.org/edc/v0.0.1/ns/", "edc:")
+_IGNORED_PROPERTIES = ("@id", "@type", "id")
+_IGNORED_DATA_ADDRESS_KEYS = ("@type",)
+
+
+def _strip_namespace(key):
+    for namespace in _NAMESPACES:
+        if key.startswith(namespace):
+            return key[len(namespace):]
+    return key
+
+
+def _normalize(mapping, ignored):
+    normalized = {}
+    for key, value in (mapping or {}).items():
+        key = _strip_namespace(key)
+        if key in ignored:
+            continue
+        normalized[key] = value
+    return normalized
+
+
+def asset_fingerprint(asset_data):
+    """
+    The parts of an asset that are compared when syncing: properties and data address without JSON-LD noise and the
+    id property the connector adds on its own.
+    """
+    return {
+        "properties": _normalize(asset_data.get("properties"), _IGNORED_PROPERTIES),
+        "dataAddress": _normalize(asset_data.get("dataAddress"), _IGNORED_DATA_ADDRESS_KEYS)
+    }
+
+
+def load_manifest(path):
+    # a JSON list of asset bodies as built by common.create_asset_data
+    with open(path) as f:
+        return json.load(f)
+
+
+def iter_assets(connector_management_url, edc_headers, page_size=500, filter_expression=None, client=None):
+    # sorted by id, offset paging over an unordered listing can skip or repeat assets
+    offset = 0
+    while True:
+        status_code, page = query_assets(connector_management_url, edc_headers,
+                                         create_query_spec(offset, page_size, filter_expression, sort_field="id"),
+                                         client)
+        if status_code >= 400 or not isinstance(page, list):
+            raise ManagementApiError("listing assets failed with " + str(status_code) + ": " + str(page), status_code,
+                                     page)
+        yield from page
+        if len(page) < page_size:
+            return
+        offset += page_size
+
+
+class SyncPlan:
+    def __init__(self, creates, updates, deletes, unchanged):
+        self.creates = creates
+        self.updates = updates
+        self.deletes = deletes
+        self.unchanged = unchanged
+
+    @property
+    def writes(self):
+        return len(self.creates) + len(self.updates) + len(self.deletes)
+
+
+def plan_sync(desired_assets, current_assets, prune=False):
+    """
+    Diffs the desired asset bodies against the assets currently in the connector. Returns a SyncPlan with the asset
+    bodies to create and update and the ids to delete (only with prune=True).
+    """
+    desired = {asset["@id"]: asset for asset in desired_assets}
+    current = {asset["@id"]: asset_fingerprint(asset) for asset in current_assets}
+
+    creates, updates, unchanged = [], [], 0
+    for asset_id, asset in desired.items():
+        if asset_id not in current:
+            creates.append(asset)
+        elif asset_fingerprint(asset) != current[asset_id]:
+            updates.append(asset)
+        else:
+            unchanged += 1
+    deletes = [asset_id for asset_id in current if asset_id not in desired] if prune else []
+    return SyncPlan(creates, updates, deletes, unchanged)
+
+
+def sync_assets(desired_assets, connector_management_url, edc_headers, prune=False, filter_expression=None,
+                dry_run=False, workers=16, page_size=500, client=None):
+    """
+    Brings the assets of a connector in line with desired_assets and only sends the necessary writes. The current
+    assets are listed page by page via v3/assets/request, filter_expression restricts both listing and pruning to
+    a subset of the connector's assets. Assets missing from desired_assets are only deleted with prune=True, without
+    a filter_expression that includes every other asset of the connector. Returns (plan, BulkResult).
+    """
+    client = client if client is not None else EdcClient(pool_size=workers)
+    current = iter_assets(connector_management_url, edc_headers, page_size, filter_expression, client)
+    plan = plan_sync(desired_assets, current, prune)
+    if dry_run:
+        return plan, BulkResult()
+
+    operations = [("create", asset) for asset in plan.creates] + \
+                 [("update", asset) for asset in plan.updates] + \
+                 [("delete", asset_id) for asset_id in plan.deletes]
+
+    def apply(operation):
+        kind, target = operation
+        if kind == "create":
+            return create_asset_from_data(target, connector_management_url, edc_headers, verbose=False, client=client)
+        if kind == "update":
+            update_asset(dict(target, **{"@context": CONTEXT}), connector_management_url, edc_headers,
+                         verbose=False, client=client)
+            return target["@id"]
+        delete_asset(target, connector_management_url, edc_headers, verbose=False, client=client)
+        return target
+
+    return plan, run_bulk(operations, apply, workers)
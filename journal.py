@@ -0,0 +1,121 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+
+from common import ManagementApiError
+
+
+class FlowJournal:
+    """
+    Append-only journal of the steps of many flows, one JSON line {"flow", "step", "value", "at"} per step.
+
+    Every line is flushed (and with sync=True fsynced) before record() returns, so a step that returned is in the
+    journal even if the process dies right after. A line torn by a crash while it was written is cut off when the
+    journal is opened again. With resume=True the steps of an existing journal are loaded, so flows can skip what
+    they already did; without it an existing non-empty journal is refused instead of overwritten.
+    """
+
+    def __init__(self, path, resume=False, sync=True):
+        self.path = path
+        self.sync = sync
+        self.resumed = 0
+        self._flows = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            if not resume:
+                raise FileExistsError("journal " + path + " already exists, resume it or remove it")
+            self._load()
+        self._file = open(path, "ab")
+
+    def _load(self):
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            self._flows.setdefault(entry["flow"], {})[entry["step"]] = entry["value"]
+        self.resumed = len(self._flows)
+
+    def record(self, flow, step, value=True):
+        line = json.dumps({"flow": flow, "step": step, "value": value, "at": time.time()}).encode() + b"\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+            self._flows.setdefault(flow, {})[step] = value
+
+    def get(self, flow, step, default=None):
+        with self._lock:
+            return self._flows.get(flow, {}).get(step, default)
+
+    def steps(self, flow):
+        with self._lock:
+            return dict(self._flows.get(flow, {}))
+
+    def flows(self):
+        with self._lock:
+            return list(self._flows)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+async def journaled(journal, flow, step, run, created_id=None):
+    """
+    Returns the value journaled for step of flow, otherwise awaits run() and journals its result.
+    created_id is the client-chosen id of a create: if the create is rejected with 409, an earlier run created it
+    but died before journaling it, so created_id is journaled and returned instead of failing.
+    """
+    if journal is None:
+        return await run()
+    value = journal.get(flow, step)
+    if value is not None:
+        return value
+    try:
+        value = await run()
+    except ManagementApiError as e:
+        if created_id is None or e.status_code != 409:
+            raise
+        value = created_id
+    journal.record(flow, step, value)
+    return value
+
+
+async def new_id():
+    # for journaling a client-generated id before the create that uses it
+    return str(uuid.uuid4())
+
+
+async def done(awaitable):
+    # steps without a result are journaled as True
+    await awaitable
+    return True
@@ -0,0 +1,226 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import asyncio
+import time
+
+import common
+import instrumentation
+from async_client import timed
+
+STAGES = ("provision", "catalog", "negotiate", "transfer", "deprovision")
+
+
+class PipelineStage:
+    """
+    A bounded input queue served by workers coroutines running handler(item). busy_seconds is the time spent in
+    the handler, blocked_seconds the time finished items waited for room in the queue of the next stage, so a stage
+    with a full queue and high utilization is the bottleneck and a stage with high blocked_seconds feeds one.
+    """
+
+    def __init__(self, name, handler, workers=4, queue_size=16):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0
+        self.max_depth = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.start = time.perf_counter()
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    @property
+    def utilization(self):
+        elapsed = time.perf_counter() - self.start
+        return self.busy_seconds / (self.workers * elapsed) if elapsed else 0.0
+
+    async def put(self, item):
+        await self.queue.put(item)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def snapshot(self):
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "failed": self.failed,
+            "utilization": round(self.utilization, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3)
+        }
+
+
+class FlowPipeline:
+    """
+    Runs many provider/consumer flows (see async_client.run_transfer_flow) as a pipeline of stages: provision
+    (asset, policy, contract definition), catalog, negotiate (request and wait for the agreement), transfer (request
+    and wait for completion) and, with deprovision=True, deprovision. Every stage has its own workers and bounded
+    queue, so catalog requests, negotiations and transfers of different flows overlap and a flow moves to the next
+    stage as soon as its current one is done. workers maps stage names to worker counts (default 4).
+    Stage queue depths and utilization are available through snapshot() while and after run() is running.
+    """
+
+    def __init__(self, aclient, provider_management_url, provider_dsp_url, provider_headers, consumer_management_url,
+                 consumer_headers, connector_id="provider", policy_id=None, deprovision=False, workers=None,
+                 queue_size=16, verbose=False):
+        self.aclient = aclient
+        self.provider_management_url = provider_management_url
+        self.provider_dsp_url = provider_dsp_url
+        self.provider_headers = provider_headers
+        self.consumer_management_url = consumer_management_url
+        self.consumer_headers = consumer_headers
+        self.connector_id = connector_id
+        self.policy_id = policy_id
+        self.verbose = verbose
+        self.workers = workers or {}
+        self.queue_size = queue_size
+        self.stages = [PipelineStage(name, getattr(self, "_" + name), self.workers.get(name, 4), queue_size)
+                       for name in STAGES if name != "deprovision" or deprovision]
+
+    def snapshot(self):
+        return {stage.name: stage.snapshot() for stage in self.stages}
+
+    def bottleneck(self):
+        # the stage whose workers are busy the largest share of the time
+        return max(self.stages, key=lambda stage: stage.utilization).name
+
+    async def run(self, flows, timings=None):
+        """
+        Pushes every flow (a dict with asset_id, data_address and data_destination) through the stages and returns
+        one entry per flow in order: the dict of created ids like run_transfer_flow, or the exception the flow
+        failed with. If timings is a list, a dict of phase durations is appended to it for every successful flow,
+        total includes the time the flow waited in queues.
+        """
+        results = []
+        remaining = 0
+        fed = False
+        finished = asyncio.Event()
+
+        def complete(item, result):
+            nonlocal remaining
+            results[item["index"]] = result
+            remaining -= 1
+            if fed and remaining == 0:
+                finished.set()
+
+        async def work(index, stage):
+            following = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            while True:
+                item = await stage.queue.get()
+                stage.busy += 1
+                start = time.perf_counter()
+                try:
+                    with instrumentation.span("pipeline_" + stage.name, asset_id=item["flow"]["asset_id"]):
+                        await stage.handler(item)
+                except Exception as e:
+                    stage.failed += 1
+                    complete(item, e)
+                    continue
+                finally:
+                    stage.busy -= 1
+                    stage.busy_seconds += time.perf_counter() - start
+                stage.processed += 1
+                if following is None:
+                    if timings is not None:
+                        item["timings"]["total"] = time.perf_counter() - item["queued"]
+                        timings.append(item["timings"])
+                    complete(item, item["result"])
+                else:
+                    start = time.perf_counter()
+                    await following.put(item)
+                    stage.blocked_seconds += time.perf_counter() - start
+
+        for stage in self.stages:
+            stage.start = time.perf_counter()
+        workers = [asyncio.create_task(work(index, stage))
+                   for index, stage in enumerate(self.stages) for _ in range(stage.workers)]
+        try:
+            for flow in flows:
+                results.append(None)
+                remaining += 1
+                await self.stages[0].put({"index": len(results) - 1, "flow": flow, "timings": {},
+                                          "queued": time.perf_counter(), "result": {"asset_id": flow["asset_id"]}})
+            fed = True
+            if remaining:
+                await finished.wait()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return results
+
+    async def _provision(self, item):
+        flow, result, timings = item["flow"], item["result"], item["timings"]
+        with timed(timings, "asset"):
+            asset_id = await self.aclient.create_asset(flow["asset_id"], "My Asset", "Description", "v1.2.3",
+                                                       "application/json", flow["data_address"],
+                                                       self.provider_management_url, self.provider_headers,
+                                                       self.verbose)
+        policy_id = flow.get("policy_id", self.policy_id)
+        if policy_id is None:
+            with timed(timings, "policy"):
+                policy_id = await self.aclient.create_policy(asset_id + "-policy", self.provider_management_url,
+                                                             self.provider_headers, self.verbose)
+        with timed(timings, "contract_definition"):
+            await self.aclient.create_contract_definition(policy_id, policy_id, asset_id,
+                                                          self.provider_management_url, self.provider_headers,
+                                                          self.verbose)
+        result["asset_id"], result["policy_id"] = asset_id, policy_id
+
+    async def _catalog(self, item):
+        asset_id, timings = item["result"]["asset_id"], item["timings"]
+        with timed(timings, "catalog"):
+            datasets = await self.aclient.query_catalog(self.provider_dsp_url, self.consumer_management_url,
+                                                        self.consumer_headers, self.verbose,
+                                                        query_spec=common.create_query_spec(filter_expression=[
+                                                            common.create_criterion(
+                                                                "https://w3id.org/edc/v0.0.1/ns/id", "=",
+                                                                asset_id)]))
+        offering_data = common.find_offer(datasets, asset_id)
+        if offering_data is None:
+            raise LookupError("asset " + asset_id + " not found in catalog of " + self.provider_dsp_url)
+        item["policy"] = offering_data["odrl:hasPolicy"]
+
+    async def _negotiate(self, item):
+        result, timings = item["result"], item["timings"]
+        with timed(timings, "negotiation_request"):
+            result["negotiation_id"] = await self.aclient.negotiate_offer(
+                self.connector_id, "consumer", self.connector_id, self.provider_dsp_url, item["policy"],
+                self.consumer_management_url, self.consumer_headers, self.verbose)
+        with timed(timings, "negotiation"):
+            result["agreement_id"] = await self.aclient.poll_negotiation_until_finalized(
+                self.consumer_management_url, result["negotiation_id"], self.consumer_headers, self.verbose)
+
+    async def _transfer(self, item):
+        flow, result, timings = item["flow"], item["result"], item["timings"]
+        with timed(timings, "transfer_request"):
+            result["transfer_id"] = await self.aclient.initiate_data_transfer(
+                self.connector_id, self.provider_dsp_url, result["agreement_id"], result["asset_id"],
+                flow["data_destination"], self.consumer_management_url, self.consumer_headers, self.verbose)
+        with timed(timings, "transfer"):
+            await self.aclient.poll_transfer_until_completed(self.consumer_management_url, result["transfer_id"],
+                                                             self.consumer_headers, self.verbose)
+
+    async def _deprovision(self, item):
+        with timed(item["timings"], "deprovision"):
+            await self.aclient.deprovision_s3_token(self.consumer_management_url, item["result"]["transfer_id"],
+                                                    self.consumer_headers, self.verbose)
@@ -0,0 +1,180 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import requests
+
+from common import ManagementApiError, create_query_spec, get_policy_definition, query_policy_definitions
+
+_IGNORED_KEYS = ("@id", "@context", "odrl:uid", "uid")
+
+
+def normalize_policy(value):
+    """
+    Brings a policy into a canonical form so the body we send and the body the connector returns compare equal:
+    the odrl: prefix is stripped from keys and types, types are lower case, empty values and ids are dropped.
+    """
+    if isinstance(value, dict):
+        normalized = {}
+        for key, item in value.items():
+            if key in _IGNORED_KEYS:
+                continue
+            key = key[len("odrl:"):] if key.startswith("odrl:") else key
+            if key == "@type" and isinstance(item, str):
+                item = item.split(":")[-1].lower()
+            item = normalize_policy(item)
+            if item in (None, [], {}, ""):
+                continue
+            normalized[key] = item
+        return normalized
+    if isinstance(value, list):
+        items = [normalize_policy(item) for item in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+    return value
+
+
+def policy_content_hash(policy):
+    # shared by PolicyIndex and agreement_store.AgreementStore, so both agree on what is the same policy
+    return hashlib.sha256(json.dumps(normalize_policy(policy), sort_keys=True, separators=(",", ":")).encode()) \
+        .hexdigest()
+
+
+class PolicyIndex:
+    """
+    Content hash -> policy definition id index per connector, used by common.create_policy(index=...) to reuse
+    policy definitions with identical content instead of creating duplicates.
+
+    The policy store of a connector is only listed on the first miss for that connector, afterwards policies created
+    through the index are added directly. With a path the index is persisted as JSON between runs. Since connectors
+    may have lost their policies in the meantime (e.g. after a restart with an in-memory store), every id is checked
+    against the connector once per run before it is returned, ids the connector no longer knows are removed.
+    A failed listing counts as miss, so the caller creates the policy.
+    """
+
+    def __init__(self, path=None, page_size=500):
+        self.path = path
+        self.page_size = page_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._index = {}
+        self._scanned = set()
+        # (connector, policy id) pairs confirmed to exist during this run
+        self._verified = set()
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self._index = json.load(f)
+
+    def find(self, policy, connector_management_url, edc_headers, client=None):
+        content_hash = policy_content_hash(policy)
+        with self._lock:
+            policy_id = self._index.get(connector_management_url, {}).get(content_hash)
+        if policy_id is not None and not self._exists(connector_management_url, policy_id, content_hash,
+                                                      edc_headers, client):
+            policy_id = None
+        if policy_id is None and connector_management_url not in self._scanned:
+            try:
+                self.scan(connector_management_url, edc_headers, client)
+            except (ManagementApiError, requests.RequestException):
+                pass
+            else:
+                with self._lock:
+                    policy_id = self._index.get(connector_management_url, {}).get(content_hash)
+        if policy_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return policy_id
+
+    def _exists(self, connector_management_url, policy_id, content_hash, edc_headers, client):
+        with self._lock:
+            if (connector_management_url, policy_id) in self._verified:
+                return True
+        try:
+            status_code, _ = get_policy_definition(connector_management_url, policy_id, edc_headers, client)
+        except requests.RequestException:
+            return False
+        if status_code == 200:
+            with self._lock:
+                self._verified.add((connector_management_url, policy_id))
+            return True
+        if status_code == 404:
+            with self._lock:
+                index = self._index.get(connector_management_url, {})
+                if index.get(content_hash) == policy_id:
+                    del index[content_hash]
+            self.save()
+        return False
+
+    def add(self, policy, policy_id, connector_management_url):
+        with self._lock:
+            self._index.setdefault(connector_management_url, {})[policy_content_hash(policy)] = policy_id
+            self._verified.add((connector_management_url, policy_id))
+        self.save()
+
+    def scan(self, connector_management_url, edc_headers, client=None):
+        # lists all policy definitions of the connector and makes them its index, dropping ids it no longer has
+        found = {}
+        offset = 0
+        while True:
+            status_code, page = query_policy_definitions(connector_management_url, edc_headers,
+                                                         create_query_spec(offset, self.page_size), client)
+            if status_code >= 400 or not isinstance(page, list):
+                raise ManagementApiError("listing policy definitions failed with " + str(status_code) + ": " +
+                                         str(page), status_code, page)
+            for definition in page:
+                policy = definition.get("policy") or definition.get("edc:policy")
+                if policy is not None:
+                    found.setdefault(policy_content_hash(policy), definition["@id"])
+            if len(page) < self.page_size:
+                break
+            offset += self.page_size
+        with self._lock:
+            self._index[connector_management_url] = found
+            self._verified.update((connector_management_url, policy_id) for policy_id in found.values())
+            self._scanned.add(connector_management_url)
+        self.save()
+
+    def invalidate(self, connector_management_url=None):
+        with self._lock:
+            if connector_management_url is None:
+                self._index.clear()
+                self._scanned.clear()
+                self._verified.clear()
+            else:
+                self._index.pop(connector_management_url, None)
+                self._scanned.discard(connector_management_url)
+                self._verified = {key for key in self._verified if key[0] != connector_management_url}
+        self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+        # saves are serialized so the last snapshot taken is the one left in the file, the temporary file is unique
+        # in case other processes save the same index
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps(self._index)
+            with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(os.path.abspath(self.path)),
+                                             prefix=os.path.basename(self.path) + ".", suffix=".tmp",
+                                             delete=False) as f:
+                f.write(data)
+            os.replace(f.name, self.path)
@@ -0,0 +1,176 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import asyncio
+import random
+import threading
+import time
+
+NEGOTIATION_DONE_STATES = ("FINALIZED",)
+NEGOTIATION_FAILED_STATES = ("TERMINATING", "TERMINATED")
+# transfers move on to deprovisioning after COMPLETED as well as after TERMINATED, only the latter carry an errorDetail
+TRANSFER_DEPROVISION_STATES = ("DEPROVISIONING", "DEPROVISIONED")
+TRANSFER_DONE_STATES = ("COMPLETED",) + TRANSFER_DEPROVISION_STATES
+TRANSFER_FAILED_STATES = ("TERMINATING", "TERMINATED")
+
+
+def is_failed(state, body, failed_states):
+    # whether state ends a process as failed, including transfers that are deprovisioned after they were terminated
+    return state in failed_states or \
+        (state in TRANSFER_DEPROVISION_STATES and isinstance(body, dict) and bool(body.get("errorDetail")))
+
+
+class PollFailedError(RuntimeError):
+    def __init__(self, message, state=None, body=None, polls=0):
+        super().__init__(message)
+        self.state = state
+        self.body = body
+        self.polls = polls
+
+
+class PollTimeoutError(TimeoutError):
+    def __init__(self, message, state=None, polls=0):
+        super().__init__(message)
+        self.state = state
+        self.polls = polls
+
+
+class PollingStrategy:
+    """
+    Exponential backoff with jitter between status requests and an overall deadline in seconds (None waits forever).
+    The first request is sent immediately, the following ones wait initial_interval, initial_interval * multiplier,
+    ... up to max_interval, each randomized by +/- jitter (fraction of the interval).
+    """
+
+    def __init__(self, initial_interval=0.1, max_interval=2.0, multiplier=1.5, jitter=0.2, deadline=600.0):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+
+    @classmethod
+    def fixed(cls, interval, deadline=None):
+        return cls(initial_interval=interval, max_interval=interval, multiplier=1.0, jitter=0.0, deadline=deadline)
+
+    def intervals(self):
+        interval = self.initial_interval
+        while True:
+            yield max(0.0, interval * (1 + random.uniform(-self.jitter, self.jitter)))
+            interval = min(self.max_interval, interval * self.multiplier)
+
+
+DEFAULT_STRATEGY = PollingStrategy()
+
+
+class PollStats:
+    """
+    Aggregates how many status requests each wait needed, to tune the strategy against connector load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.polls = 0
+        self.max_polls = 0
+        self.total_seconds = 0.0
+
+    def record(self, polls, elapsed):
+        with self._lock:
+            self.waits += 1
+            self.polls += polls
+            self.max_polls = max(self.max_polls, polls)
+            self.total_seconds += elapsed
+
+    @property
+    def mean_polls(self):
+        return self.polls / self.waits if self.waits else 0.0
+
+
+class _PollRun:
+    # bookkeeping shared by the sync and async poll loops
+
+    def __init__(self, what, done_states, failed_states, strategy, stats):
+        self.what = what
+        self.done_states = done_states
+        self.failed_states = failed_states
+        self.strategy = strategy if strategy is not None else DEFAULT_STRATEGY
+        self.stats = stats
+        self.polls = 0
+        self.state = None
+        self.start = time.monotonic()
+        self._intervals = self.strategy.intervals()
+
+    def check(self, status_code, body):
+        # returns True if the awaited state was reached, raises on terminal failures
+        self.polls += 1
+        if status_code == 404:
+            self._finish()
+            raise PollFailedError(self.what + " not found", body=body, polls=self.polls)
+        if status_code >= 400 or not isinstance(body, dict):
+            return False
+        self.state = body.get("state")
+        if is_failed(self.state, body, self.failed_states):
+            self._finish()
+            raise PollFailedError(self.what + " ended in state " + self.state + ": " + str(body.get("errorDetail")),
+                                  state=self.state, body=body, polls=self.polls)
+        if self.state in self.done_states:
+            self._finish()
+            return True
+        return False
+
+    def next_delay(self):
+        delay = next(self._intervals)
+        if self.strategy.deadline is not None:
+            remaining = self.start + self.strategy.deadline - time.monotonic()
+            if remaining <= 0:
+                self._finish()
+                raise PollTimeoutError(self.what + " did not finish within " + str(self.strategy.deadline) +
+                                       " s, last state " + str(self.state), state=self.state, polls=self.polls)
+            delay = min(delay, remaining)
+        return delay
+
+    def _finish(self):
+        if self.stats is not None:
+            self.stats.record(self.polls, time.monotonic() - self.start)
+
+
+def poll_until(fetch, what, done_states, failed_states, strategy=None, stats=None, on_poll=None):
+    """
+    Calls fetch() -> (status_code, body) until body["state"] is one of done_states and returns (status_code, body,
+    polls). Raises PollFailedError on failed_states and PollTimeoutError once the strategy deadline has passed.
+    """
+    run = _PollRun(what, done_states, failed_states, strategy, stats)
+    while True:
+        status_code, body = fetch()
+        if on_poll is not None:
+            on_poll(status_code, body)
+        if run.check(status_code, body):
+            return status_code, body, run.polls
+        time.sleep(run.next_delay())
+
+
+async def poll_until_async(fetch, what, done_states, failed_states, strategy=None, stats=None, on_poll=None):
+    """
+    Same as poll_until, but fetch is a coroutine function and the delays are awaited.
+    """
+    run = _PollRun(what, done_states, failed_states, strategy, stats)
+    while True:
+        status_code, body = await fetch()
+        if on_poll is not None:
+            on_poll(status_code, body)
+        if run.check(status_code, body):
+            return status_code, body, run.polls
+        await asyncio.sleep(run.next_delay())
@@ -0,0 +1,182 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from client import EdcClient
+from common import ManagementApiError, create_asset, create_contract_definition, create_grouped_contract_definition, \
+    create_policy
+
+
+def create_asset_spec(asset_id, data_address, name="My Asset", description="Description", version="v1.2.3",
+                      content_type="application/json"):
+    return {
+        "asset_id": asset_id,
+        "name": name,
+        "description": description,
+        "version": version,
+        "content_type": content_type,
+        "data_address": data_address
+    }
+
+
+class BulkResult:
+    """
+    Outcome of a bulk operation: succeeded holds (item, result) and failed holds (item, exception) pairs.
+    """
+
+    def __init__(self):
+        self.succeeded = []
+        self.failed = []
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add_success(self, item, result):
+        with self._lock:
+            self.succeeded.append((item, result))
+
+    def add_failure(self, item, error):
+        with self._lock:
+            self.failed.append((item, error))
+
+    @property
+    def total(self):
+        return len(self.succeeded) + len(self.failed)
+
+    @property
+    def items_per_second(self):
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+
+def run_bulk(items, operation, workers=16, on_progress=None):
+    """
+    Applies operation to every item with a pool of worker threads. Failing items are recorded in the result instead
+    of aborting the batch. on_progress(done, result) is called after every item.
+    """
+    result = BulkResult()
+    start = time.perf_counter()
+
+    def run(item):
+        try:
+            result.add_success(item, operation(item))
+        except Exception as e:
+            result.add_failure(item, e)
+        if on_progress is not None:
+            on_progress(result.total, result)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="edc-bulk") as executor:
+        # submit lazily so huge iterables are not materialized up front
+        pending = set()
+        for item in items:
+            if len(pending) >= workers * 4:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+            pending.add(executor.submit(run, item))
+        wait(pending)
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def provision_policies(policy_ids, connector_management_url, edc_headers, workers=16, client=None, on_progress=None):
+    client = client if client is not None else EdcClient(pool_size=workers)
+    return run_bulk(policy_ids,
+                    lambda policy_id: create_policy(policy_id, connector_management_url, edc_headers, verbose=False,
+                                                    client=client),
+                    workers, on_progress)
+
+
+def group_assets_by_policies(asset_specs, access_policy_id=None, contract_policy_id=None):
+    """
+    Returns {(access policy id, contract policy id): [asset ids]} for specs that carry policy ids themselves or fall
+    back to the given ones.
+    """
+    groups = {}
+    for spec in asset_specs:
+        access_policy = spec.get("access_policy_id", access_policy_id)
+        if access_policy is None:
+            continue
+        contract_policy = spec.get("contract_policy_id", contract_policy_id) or access_policy
+        groups.setdefault((access_policy, contract_policy), []).append(spec["asset_id"])
+    return groups
+
+
+def provision_grouped_contract_definitions(asset_specs, connector_management_url, edc_headers, access_policy_id=None,
+                                           contract_policy_id=None, max_assets_per_definition=1000, workers=4,
+                                           client=None):
+    """
+    Creates one contract definition with an "id in [...]" selector per policy pair and chunk of
+    max_assets_per_definition assets instead of one definition per asset, which keeps the number of definitions the
+    connector evaluates on every catalog request small. Returns a BulkResult with the definition ids as results.
+    """
+    client = client if client is not None else EdcClient(pool_size=workers)
+    chunks = []
+    for (access_policy, contract_policy), asset_ids in group_assets_by_policies(asset_specs, access_policy_id,
+                                                                                contract_policy_id).items():
+        for offset in range(0, len(asset_ids), max_assets_per_definition):
+            chunks.append((access_policy, contract_policy, asset_ids[offset:offset + max_assets_per_definition]))
+
+    return run_bulk(chunks,
+                    lambda chunk: create_grouped_contract_definition(chunk[0], chunk[1], chunk[2],
+                                                                     connector_management_url, edc_headers,
+                                                                     verbose=False, client=client),
+                    workers)
+
+
+def provision_assets(asset_specs, connector_management_url, edc_headers, access_policy_id=None,
+                     contract_policy_id=None, workers=16, client=None, on_progress=None, grouped=False,
+                     max_assets_per_definition=1000, existing_ok=False):
+    """
+    Creates the assets described by asset_specs (see create_asset_spec) in parallel. If an access policy id is given,
+    either here or per spec, a contract definition is created for every asset as well, or with grouped=True one per
+    policy pair and max_assets_per_definition assets once all assets exist. With existing_ok=True an asset create
+    rejected with 409 counts as created, e.g. when resuming a batch whose asset ids were chosen before an earlier
+    run died, and the contract definition is created for it anyway. Returns a BulkResult with the asset ids as
+    results.
+    """
+    client = client if client is not None else EdcClient(pool_size=workers)
+
+    def provision(spec):
+        try:
+            asset_id = create_asset(spec["asset_id"], spec["name"], spec["description"], spec["version"],
+                                    spec["content_type"], spec["data_address"], connector_management_url,
+                                    edc_headers, verbose=False, client=client)
+        except ManagementApiError as e:
+            if not existing_ok or e.status_code != 409:
+                raise
+            asset_id = spec["asset_id"]
+        access_policy = spec.get("access_policy_id", access_policy_id)
+        if access_policy is not None and not grouped:
+            contract_policy = spec.get("contract_policy_id", contract_policy_id) or access_policy
+            create_contract_definition(access_policy, contract_policy, asset_id, connector_management_url,
+                                       edc_headers, verbose=False, client=client)
+        return asset_id
+
+    result = run_bulk(asset_specs, provision, workers, on_progress)
+    if grouped:
+        definitions = provision_grouped_contract_definitions([dict(spec, asset_id=asset_id)
+                                                              for spec, asset_id in result.succeeded],
+                                                             connector_management_url, edc_headers, access_policy_id,
+                                                             contract_policy_id, max_assets_per_definition,
+                                                             client=client)
+        result.elapsed += definitions.elapsed
+        # assets whose contract definition could not be created are not offered, report them as failed
+        errors = {asset_id: error for (_, _, asset_ids), error in definitions.failed for asset_id in asset_ids}
+        if errors:
+            succeeded = result.succeeded
+            result.succeeded = [(spec, asset_id) for spec, asset_id in succeeded if asset_id not in errors]
+            result.failed.extend((spec, errors[asset_id]) for spec, asset_id in succeeded if asset_id in errors)
+    return result
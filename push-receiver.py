@@ -0,0 +1,45 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import argparse
+import time
+
+from icecream import ic
+
+from push_receiver import PushReceiver
+
+"""
+Receives the data pushed by the provider in the HTTP push flow (http-push-dsp.py) on
+http://localhost:4000/api/consumer/store, so the flow can run without the Java backend service.
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=4000)
+parser.add_argument("--sink", choices=("disk", "memory", "discard"), default="disk")
+parser.add_argument("--directory", default="received")
+parser.add_argument("--log", help="append one JSON line per received push to this file")
+parser.add_argument("--report-interval", type=float, default=10.0)
+args = parser.parse_args()
+
+with PushReceiver(args.host, args.port, sink=args.sink, directory=args.directory, log_path=args.log,
+                  verbose=True) as receiver:
+    ic("Receiving pushes on", receiver.url)
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            ic(receiver.summary())
+    except KeyboardInterrupt:
+        ic(receiver.summary())
@@ -0,0 +1,164 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import asyncio
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from icecream import ic
+
+from callbacks import EmbeddedHttpServer, iter_body
+
+
+class PushRecord:
+    def __init__(self, push_id, path, content_type):
+        self.push_id = push_id
+        self.path = path
+        self.content_type = content_type
+        self.bytes = 0
+        self.started_at = time.time()
+        self.duration = None
+        self.file = None
+        self.body = None
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes / self.duration if self.duration else 0.0
+
+    def as_dict(self):
+        return {
+            "id": self.push_id,
+            "path": self.path,
+            "contentType": self.content_type,
+            "bytes": self.bytes,
+            "startedAt": self.started_at,
+            "duration": self.duration,
+            "file": self.file
+        }
+
+
+class PushReceiver(EmbeddedHttpServer):
+    """
+    Stand-in for the consumer backend of the HTTP push sample: accepts the data the provider data plane pushes to
+    consumer_backend_url (POST/PUT on any path below /api/consumer/store).
+
+    Bodies are streamed chunk by chunk: sink="disk" writes every push to its own file in directory, sink="memory"
+    keeps the body in the PushRecord (only for small payloads) and sink="discard" only counts the bytes. Every push
+    is recorded with its size and duration (and appended as a JSON line to log_path if given), many pushes can be
+    received at the same time. File writes run in the default executor, so a slow disk doesn't stall the event loop
+    serving the other pushes.
+    """
+
+    def __init__(self, host="127.0.0.1", port=4000, path="/api/consumer/store", sink="disk", directory="received",
+                 chunk_size=256 * 1024, max_records=100000, log_path=None, verbose=False):
+        super().__init__(host, port, path, name="edc-push-receiver")
+        if sink not in ("disk", "memory", "discard"):
+            raise ValueError("sink must be disk, memory or discard")
+        self.sink = sink
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.max_records = max_records
+        self.log_path = log_path
+        self.verbose = verbose
+        self.records = deque(maxlen=max_records)
+        self.total_bytes = 0
+        self.in_flight = 0
+        self.first_push_at = None
+        self.last_push_at = None
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+        if sink == "disk":
+            os.makedirs(directory, exist_ok=True)
+
+    async def handle(self, method, path, headers, reader):
+        if method not in ("POST", "PUT") or not path.startswith(self.path):
+            async for _ in iter_body(reader, headers, self.chunk_size):
+                pass
+            return 404, b""
+
+        record = PushRecord(next(self._ids), path, headers.get("content-type"))
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self.in_flight += 1
+        try:
+            if self.sink == "disk":
+                record.file = os.path.join(self.directory, str(record.push_id) + "-" +
+                                           (re.sub(r"[^A-Za-z0-9._-]", "_", path[len(self.path):].strip("/")) or
+                                            "data"))
+                f = await loop.run_in_executor(None, open, record.file, "wb")
+                try:
+                    async for chunk in iter_body(reader, headers, self.chunk_size):
+                        await loop.run_in_executor(None, f.write, chunk)
+                        record.bytes += len(chunk)
+                finally:
+                    await loop.run_in_executor(None, f.close)
+            elif self.sink == "memory":
+                body = bytearray()
+                async for chunk in iter_body(reader, headers, self.chunk_size):
+                    body += chunk
+                record.body = bytes(body)
+                record.bytes = len(body)
+            else:
+                async for chunk in iter_body(reader, headers, self.chunk_size):
+                    record.bytes += len(chunk)
+        finally:
+            self.in_flight -= 1
+        record.duration = time.perf_counter() - start
+        await loop.run_in_executor(None, self._record, record)
+        if self.verbose:
+            ic(record.push_id, record.path, record.bytes, record.duration)
+        return 200, b""
+
+    def _record(self, record):
+        with self._condition:
+            self.records.append(record)
+            self.total_bytes += record.bytes
+            if self.first_push_at is None:
+                self.first_push_at = record.started_at
+            self.last_push_at = time.time()
+            if self.log_path is not None:
+                with open(self.log_path, "a") as f:
+                    f.write(json.dumps(record.as_dict()) + "\n")
+            self._condition.notify_all()
+
+    @property
+    def pushes(self):
+        with self._condition:
+            return len(self.records)
+
+    def wait_for(self, count, timeout=None):
+        # blocks until at least count pushes have been received
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self.records) >= count, timeout):
+                raise TimeoutError(str(len(self.records)) + " of " + str(count) + " pushes received")
+            return list(self.records)
+
+    def summary(self):
+        with self._condition:
+            records = list(self.records)
+            window = (self.last_push_at - self.first_push_at) if records else 0.0
+        durations = sorted(record.duration for record in records)
+        return {
+            "pushes": len(records),
+            "bytes": sum(record.bytes for record in records),
+            "bytes_per_second": sum(record.bytes for record in records) / window if window else 0.0,
+            "duration_p50": durations[len(durations) // 2] if durations else None,
+            "duration_max": durations[-1] if durations else None
+        }
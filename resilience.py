@@ -0,0 +1,254 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+import codec
+from polling import PollingStrategy
+
+# answered without being processed, safe to repeat for every request
+REJECTED_STATUS_CODES = (429, 503)
+# the request may or may not have been processed, only repeated for idempotent requests
+AMBIGUOUS_STATUS_CODES = (500, 502, 504)
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+# POST endpoints that only read or can be repeated without effect
+IDEMPOTENT_POST_SUFFIXES = ("/request", "/deprovision")
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def _not_sent(error):
+    # the connection could not be established, so the connector has not seen the request
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def created_id(body):
+    # the client-generated id of a create request body, None if the body has none
+    if not body:
+        return None
+    try:
+        data = codec.loads(body)
+    except ValueError:
+        return None
+    return data.get("@id") if isinstance(data, dict) else None
+
+
+def is_idempotent(method, url, body=None):
+    """
+    Whether sending the request twice has the same effect as sending it once. Creates carrying their own @id are
+    idempotent because a repeated create is rejected with 409 instead of creating a second resource.
+    """
+    if method in IDEMPOTENT_METHODS:
+        return True
+    if method != "POST":
+        return False
+    if urlsplit(url).path.rstrip("/").endswith(IDEMPOTENT_POST_SUFFIXES):
+        return True
+    return created_id(body) is not None
+
+
+def retry_after(response):
+    try:
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures (5xx or connection errors) of one connector. While open, callers
+    wait in before() instead of sending requests. After reset_timeout seconds one caller is let through as probe
+    (half open), its outcome closes the breaker or opens it again for the waiting callers. A probe that hasn't reported
+    its outcome after another reset_timeout seconds is given up and the next caller probes instead. With max_wait set,
+    callers give up with CircuitOpenError after waiting that long.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, max_wait=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_wait = max_wait
+        self.state = "closed"
+        self.failures = 0
+        self.opens = 0
+        self.waited = 0.0
+        self._opened_at = None
+        self._probe_at = None
+        self._condition = threading.Condition()
+
+    def before(self):
+        with self._condition:
+            if self.state == "closed":
+                return
+            start = time.monotonic()
+            while True:
+                now = time.monotonic()
+                if self.state == "closed":
+                    break
+                if self.state == "open" and now >= self._opened_at + self.reset_timeout:
+                    self.state = "half_open"
+                    self._probe_at = now
+                    break
+                if self.state == "half_open" and now >= self._probe_at + self.reset_timeout:
+                    # the probe never reported back, let this caller probe
+                    self._probe_at = now
+                    break
+                timeout = (self._opened_at if self.state == "open" else self._probe_at) + self.reset_timeout - now
+                if self.max_wait is not None:
+                    remaining = start + self.max_wait - now
+                    if remaining <= 0:
+                        self.waited += now - start
+                        raise CircuitOpenError("circuit of connector is " + self.state + " since " +
+                                               str(round(now - self._opened_at, 1)) + " s")
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                self._condition.wait(timeout)
+            self.waited += time.monotonic() - start
+
+    def success(self):
+        with self._condition:
+            self.failures = 0
+            if self.state != "closed":
+                self.state = "closed"
+                self._condition.notify_all()
+
+    def failure(self):
+        with self._condition:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opens += 1
+                self._opened_at = time.monotonic()
+                self._condition.notify_all()
+
+
+class Resilience:
+    """
+    Retries and circuit breaking for the management API requests of an EdcClient(resilience=...).
+
+    Rejected requests (429, 503, connection refused) are repeated for every request, requests failing with
+    500/502/504 or timeouts only if they are idempotent (see is_idempotent), up to attempts tries with exponential
+    backoff (Retry-After is honoured). If a create carrying its own @id is answered with 409 after an attempt whose
+    outcome is unknown, the earlier attempt has created it, so the 409 is turned into the IdResponse of that create.
+    Each connector has its own CircuitBreaker, requests to a failing connector wait until it recovers.
+    """
+
+    def __init__(self, attempts=4, backoff=None, failure_threshold=5, reset_timeout=30.0, max_wait=None):
+        self.attempts = attempts
+        self.backoff = backoff if backoff is not None else PollingStrategy(initial_interval=0.2, max_interval=10.0,
+                                                                           multiplier=2.0, jitter=0.5, deadline=None)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_wait = max_wait
+        self.retries = 0
+        self.replayed_creates = 0
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, url):
+        parts = urlsplit(url)
+        connector = parts.scheme + "://" + parts.netloc
+        with self._lock:
+            breaker = self._breakers.get(connector)
+            if breaker is None:
+                breaker = self._breakers[connector] = CircuitBreaker(self.failure_threshold, self.reset_timeout,
+                                                                     self.max_wait)
+            return breaker
+
+    def send(self, method, url, body, send):
+        breaker = self.breaker(url)
+        delays = self.backoff.intervals()
+        idempotent = None
+        unknown_outcome = False
+        attempt = 0
+        while True:
+            attempt += 1
+            breaker.before()
+            recorded = False
+            try:
+                response = send()
+            except requests.RequestException as e:
+                breaker.failure()
+                recorded = True
+                not_sent = _not_sent(e)
+                if not not_sent and idempotent is None:
+                    idempotent = is_idempotent(method, url, body)
+                if attempt >= self.attempts or not (not_sent or idempotent):
+                    raise
+                unknown_outcome = unknown_outcome or not not_sent
+                delay = next(delays)
+            else:
+                status_code = response.status_code
+                if status_code >= 500:
+                    breaker.failure()
+                else:
+                    breaker.success()
+                recorded = True
+                retry = status_code in REJECTED_STATUS_CODES
+                if status_code in AMBIGUOUS_STATUS_CODES:
+                    if idempotent is None:
+                        idempotent = is_idempotent(method, url, body)
+                    retry = idempotent
+                if not retry or attempt >= self.attempts:
+                    if status_code == 409 and unknown_outcome and method == "POST":
+                        return self._replayed_create(response, body)
+                    return response
+                unknown_outcome = unknown_outcome or status_code in AMBIGUOUS_STATUS_CODES
+                delay = retry_after(response)
+                if delay is None:
+                    delay = next(delays)
+            finally:
+                # any other exception, e.g. raised by a wrapped client, must not leave a probe unanswered
+                if not recorded:
+                    breaker.failure()
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def _replayed_create(self, response, body):
+        entity_id = created_id(body)
+        if entity_id is None:
+            return response
+        with self._lock:
+            self.replayed_creates += 1
+        replayed = requests.Response()
+        replayed.status_code = 200
+        replayed.headers["Content-Type"] = "application/json"
+        content = codec.dumps({"@type": "IdResponse", "@id": entity_id})
+        replayed._content = content.encode() if isinstance(content, str) else content
+        replayed.url = response.url
+        replayed.request = response.request
+        replayed.encoding = "utf-8"
+        return replayed
+
+    def snapshot(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+            retries, replayed_creates = self.retries, self.replayed_creates
+        return {
+            "retries": retries,
+            "replayed_creates": replayed_creates,
+            "breakers": {connector: {"state": breaker.state, "opens": breaker.opens, "waited": breaker.waited}
+                         for connector, breaker in breakers.items()}
+        }
@@ -0,0 +1,77 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from icecream import ic
+
+from async_client import AsyncEdcClient, run_transfer_flows
+from cassette import CassetteRecorder
+from client import EdcClient
+from common import create_s3_dataaddress_source, create_s3_dataaddress_destination, edc1_headers, edc2_headers
+
+"""
+Endpoint configuration
+"""
+provider_connector_management_url = "http://localhost:19193/management/"
+provider_connector_dsp_url = "http://localhost:19194/protocol"
+
+consumer_connector_management_url = "http://localhost:29193/management/"
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--flows", type=int, default=10, help="number of S3 push flows to run")
+parser.add_argument("--concurrency", type=int, default=8, help="maximum number of requests in flight")
+parser.add_argument("--record", metavar="CASSETTE", help="record every management API exchange to this cassette")
+args = parser.parse_args()
+
+
+async def main():
+    flows = [{
+        "asset_id": str(uuid.uuid4()),
+        "data_address": create_s3_dataaddress_source("s3-eu-central-2.ionoscloud.com",
+                                                     "dev-provider-edc-bucket-possible-31952746", "testfolder/"),
+        "data_destination": create_s3_dataaddress_destination("s3-eu-central-2.ionoscloud.com",
+                                                              "dev-consumer-edc-bucket-possible-31952746",
+                                                              "myTargetPath/" + str(i) + "/"),
+        "provider_management_url": provider_connector_management_url,
+        "provider_dsp_url": provider_connector_dsp_url,
+        "provider_headers": edc2_headers,
+        "consumer_management_url": consumer_connector_management_url,
+        "consumer_headers": edc1_headers,
+        "connector_id": "edc2",
+        "deprovision": True,
+        "verbose": False
+    } for i in range(args.flows)]
+
+    recorder = CassetteRecorder(args.record) if args.record else None
+    client = recorder.wrap(EdcClient(pool_size=args.concurrency)) if recorder is not None else None
+    start = time.perf_counter()
+    async with AsyncEdcClient(max_concurrency=args.concurrency, client=client) as aclient:
+        results = await run_transfer_flows(aclient, flows)
+    elapsed = time.perf_counter() - start
+    if recorder is not None:
+        recorder.close()
+        ic(recorder.exchanges, args.record)
+
+    failures = [result for result in results if isinstance(result, BaseException)]
+    ic(len(results) - len(failures), len(failures), elapsed)
+    for failure in failures:
+        ic(failure)
+
+
+asyncio.run(main())
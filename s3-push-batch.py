@@ -0,0 +1,73 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import argparse
+import asyncio
+import uuid
+
+from icecream import ic
+
+from async_client import AsyncEdcClient
+from common import create_policy, edc1_headers, edc2_headers
+from journal import FlowJournal
+from policy_index import PolicyIndex
+from s3_batch import push_objects, read_object_list
+
+"""
+Endpoint configuration
+"""
+provider_connector_management_url = "http://localhost:19193/management/"
+provider_connector_dsp_url = "http://localhost:19194/protocol"
+
+consumer_connector_management_url = "http://localhost:29193/management/"
+
+parser = argparse.ArgumentParser(description="Pushes every object listed in OBJECTS as its own S3 transfer")
+parser.add_argument("objects", help="file with one object key per line, optionally followed by a tab and the size")
+parser.add_argument("--storage", default="s3-eu-central-2.ionoscloud.com")
+parser.add_argument("--source-bucket", default="dev-provider-edc-bucket-possible-31952746")
+parser.add_argument("--source-prefix", default="", help="prefix stripped from the keys for the destination path")
+parser.add_argument("--destination-bucket", default="dev-consumer-edc-bucket-possible-31952746")
+parser.add_argument("--destination-prefix", default="myTargetPath/")
+parser.add_argument("--concurrency", type=int, default=8, help="number of objects transferred at the same time")
+parser.add_argument("--deprovision-batch-size", type=int, default=50)
+parser.add_argument("--journal", help="journal the steps of every object to this file")
+parser.add_argument("--resume", action="store_true", help="continue the batch journaled in --journal")
+args = parser.parse_args()
+
+
+async def main():
+    objects = read_object_list(args.objects)
+    ic.disable()
+    policy_id = create_policy(str(uuid.uuid4()), provider_connector_management_url, edc2_headers, verbose=False,
+                              index=PolicyIndex("policies.json"))
+    journal = FlowJournal(args.journal, resume=args.resume) if args.journal else None
+    try:
+        async with AsyncEdcClient(max_concurrency=4 * args.concurrency) as aclient:
+            progress = await push_objects(aclient, objects, args.storage, args.source_bucket,
+                                          args.destination_bucket, args.destination_prefix,
+                                          provider_connector_management_url, provider_connector_dsp_url, edc2_headers,
+                                          consumer_connector_management_url, edc1_headers, policy_id,
+                                          source_prefix=args.source_prefix, concurrency=args.concurrency,
+                                          deprovision_batch_size=args.deprovision_batch_size, journal=journal)
+    finally:
+        if journal is not None:
+            journal.close()
+    ic.enable()
+    ic(progress.snapshot(), progress.bytes_per_second)
+    for key, error in progress.failures:
+        ic(key, error)
+
+
+asyncio.run(main())
@@ -13,11 +13,15 @@
   See the License for the specific language governing permissions and
   limitations under the License.
 """
+import argparse
 from icecream import ic
 import uuid
+from cassette import CassetteRecorder
+from client import EdcClient
 from common import create_asset, create_policy, create_contract_definition, deprovision_s3_token, query_catalog, \
     negotiate_offer, poll_negotiation_until_finalized, initiate_data_transfer, poll_transfer_until_completed, \
-    create_s3_dataaddress_source, create_s3_dataaddress_destination, edc1_headers, edc2_headers
+    create_s3_dataaddress_source, create_s3_dataaddress_destination, edc1_headers, edc2_headers, set_default_client
+from policy_index import PolicyIndex
 
 """
 Endpoint configuration
@@ -27,6 +31,15 @@ provider_connector_dsp_url = "http://localhost:19194/protocol"
 
 consumer_connector_management_url = "http://localhost:29193/management/"
 
+parser = argparse.ArgumentParser()
+parser.add_argument("--record", metavar="CASSETTE", help="record every management API exchange to this cassette")
+args = parser.parse_args()
+
+# all helpers below use the default client, so wrapping it records the whole flow
+recorder = CassetteRecorder(args.record) if args.record else None
+if recorder is not None:
+    set_default_client(recorder.wrap(EdcClient()))
+
 
 """
 Create Asset
@@ -44,7 +57,9 @@ Create Policy
 
 # Provider
 ic("Creating policy in provider connector")
-policy_id = create_policy(str(uuid.uuid4()), provider_connector_management_url, edc2_headers)
+# reuse an existing policy definition with the same content instead of creating a new one on every run
+policy_id = create_policy(str(uuid.uuid4()), provider_connector_management_url, edc2_headers,
+                          index=PolicyIndex("policies.json"))
 
 """
 Create contract definition
@@ -105,4 +120,8 @@ Deprovision S3 token
 """
 # Consumer asks own connector for status
 ic("Deprovision generated S3 Token")
-deprovision_s3_token(consumer_connector_management_url, transfer_id, edc1_headers)
\ No newline at end of file
+deprovision_s3_token(consumer_connector_management_url, transfer_id, edc1_headers)
+
+if recorder is not None:
+    recorder.close()
+    ic(recorder.exchanges, args.record)
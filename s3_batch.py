@@ -0,0 +1,206 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import asyncio
+import functools
+import time
+import uuid
+
+from icecream import ic
+
+from catalog import find_dataset, offers
+from common import create_s3_dataaddress_source, create_s3_dataaddress_destination
+from journal import done, journaled, new_id
+from provisioning import create_asset_spec, provision_assets
+
+
+def read_object_list(path):
+    """
+    Reads the objects to transfer, one key per line, optionally followed by a tab and the size in bytes
+    (e.g. converted from the output of "mc ls --recursive" or "aws s3 ls --recursive").
+    """
+    objects = []
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            key, _, size = line.partition("\t")
+            objects.append((key, int(size) if size.strip() else 0))
+    return objects
+
+
+class TransferProgress:
+    """
+    Aggregated state of a batch of transfers. Byte counts are based on the object sizes passed in, the connector
+    does not report transferred bytes.
+    """
+
+    def __init__(self, objects):
+        self.total = len(objects)
+        self.bytes_total = sum(size for _, size in objects)
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.bytes_done = 0
+        self.deprovisioned = 0
+        self.failures = []
+        self.start = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes_done / self.elapsed if self.elapsed else 0.0
+
+    def snapshot(self):
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+            "deprovisioned": self.deprovisioned,
+            "elapsed": round(self.elapsed, 3)
+        }
+
+
+async def push_objects(aclient, objects, storage, source_bucket, destination_bucket, destination_prefix,
+                       provider_management_url, provider_dsp_url, provider_headers, consumer_management_url,
+                       consumer_headers, policy_id, connector_id="edc2", source_prefix="", concurrency=8,
+                       deprovision_batch_size=50, on_progress=None, verbose=False, journal=None):
+    """
+    Transfers every (key, size) in objects from source_bucket to destination_bucket as its own S3 push transfer.
+
+    All assets are created up front with grouped contract definitions, then at most concurrency objects are
+    negotiated and transferred at the same time. The temporary S3 tokens of finished transfers are deprovisioned
+    in batches of deprovision_batch_size. on_progress(progress) is called whenever an object finishes.
+    With a journal.FlowJournal, the steps of every object are journaled under its key. Resuming a batch with the
+    same journal skips finished objects, reuses provisioned assets and waits for journaled negotiations and
+    transfers instead of starting new ones. Asset ids are journaled before the assets are created, so an asset
+    created by a run that died before journaling it is recognized by the 409 of its create instead of duplicated.
+    Returns the TransferProgress of the batch.
+    """
+    progress = TransferProgress(objects)
+    loop = asyncio.get_running_loop()
+    to_deprovision = []
+    assets = {}
+    to_provision = {}
+    for key, size in objects:
+        steps = journal.steps(key) if journal is not None else {}
+        if steps.get("deprovisioned"):
+            progress.completed += 1
+            progress.bytes_done += size
+            progress.deprovisioned += 1
+        elif steps.get("transfer_completed"):
+            progress.completed += 1
+            progress.bytes_done += size
+            to_deprovision.append((key, steps["transfer"]))
+        elif "asset" in steps:
+            assets[steps["asset"]] = (key, size)
+        else:
+            # assets are only journaled once their contract definition exists, the id they are created with before
+            asset_id = steps.get("asset_id")
+            if asset_id is None:
+                asset_id = str(uuid.uuid4())
+                if journal is not None:
+                    journal.record(key, "asset_id", asset_id)
+            to_provision[asset_id] = (key, size)
+
+    specs = [create_asset_spec(asset_id, create_s3_dataaddress_source(storage, source_bucket, key), name=key)
+             for asset_id, (key, _) in to_provision.items()]
+    provisioned = await loop.run_in_executor(None, functools.partial(
+        provision_assets, specs, provider_management_url, provider_headers, access_policy_id=policy_id,
+        workers=concurrency, client=aclient.client, grouped=True, existing_ok=journal is not None))
+    for spec, error in provisioned.failed:
+        progress.failed += 1
+        progress.failures.append((to_provision[spec["asset_id"]][0], error))
+    for spec, asset_id in provisioned.succeeded:
+        key, size = to_provision[spec["asset_id"]]
+        if journal is not None:
+            journal.record(key, "asset", asset_id)
+        assets[asset_id] = (key, size)
+
+    async def deprovision(batch):
+        async def deprovision_one(key, transfer_id):
+            await aclient.deprovision_s3_token(consumer_management_url, transfer_id, consumer_headers, verbose)
+            if journal is not None:
+                journal.record(key, "deprovisioned")
+
+        results = await asyncio.gather(*(deprovision_one(key, transfer_id) for key, transfer_id in batch),
+                                       return_exceptions=True)
+        for (key, _), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                # not journaled as deprovisioned, so resuming the batch retries it
+                progress.failures.append((key, result))
+                if verbose:
+                    ic(key, result)
+            else:
+                progress.deprovisioned += 1
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def push(asset_id, key, size):
+        async with semaphore:
+            progress.in_flight += 1
+            try:
+                async def negotiate():
+                    dataset = await aclient.call(find_dataset, provider_dsp_url, consumer_management_url,
+                                                 consumer_headers, asset_id)
+                    if dataset is None:
+                        raise LookupError("asset " + asset_id + " for " + key + " not found in catalog")
+                    return await aclient.negotiate_offer(connector_id, "consumer", connector_id, provider_dsp_url,
+                                                         offers(dataset)[0], consumer_management_url,
+                                                         consumer_headers, verbose)
+
+                negotiation_id = await journaled(journal, key, "negotiation", negotiate)
+                agreement_id = await journaled(journal, key, "agreement",
+                                               lambda: aclient.poll_negotiation_until_finalized(
+                                                   consumer_management_url, negotiation_id, consumer_headers,
+                                                   verbose))
+                destination = create_s3_dataaddress_destination(storage, destination_bucket,
+                                                                destination_prefix + key[len(source_prefix):])
+                # journaled before it is requested, so a resumed batch can't start a second transfer
+                transfer_id = await journaled(journal, key, "transfer_id", new_id)
+                transfer_id = await journaled(journal, key, "transfer", lambda: aclient.initiate_data_transfer(
+                    connector_id, provider_dsp_url, agreement_id, asset_id, destination, consumer_management_url,
+                    consumer_headers, verbose, transfer_id=transfer_id), created_id=transfer_id)
+                await journaled(journal, key, "transfer_completed", lambda: done(
+                    aclient.poll_transfer_until_completed(consumer_management_url, transfer_id, consumer_headers,
+                                                          verbose)))
+                progress.completed += 1
+                progress.bytes_done += size
+                to_deprovision.append((key, transfer_id))
+            except Exception as e:
+                progress.failed += 1
+                progress.failures.append((key, e))
+                if verbose:
+                    ic(key, e)
+            finally:
+                progress.in_flight -= 1
+        if len(to_deprovision) >= deprovision_batch_size:
+            batch = to_deprovision[:]
+            to_deprovision.clear()
+            await deprovision(batch)
+        if on_progress is not None:
+            on_progress(progress)
+
+    await asyncio.gather(*(push(asset_id, key, size) for asset_id, (key, size) in assets.items()))
+    if to_deprovision:
+        await deprovision(to_deprovision)
+    return progress
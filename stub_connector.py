@@ -0,0 +1,599 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+import requests
+
+from callbacks import EmbeddedHttpServer, read_body
+
+EDC_NAMESPACE = "https://w3id.org/edc/v0.0.1/ns/"
+
+RESPONSE_CONTEXT = {
+    "@vocab": EDC_NAMESPACE,
+    "edc": EDC_NAMESPACE,
+    "odrl": "http://www.w3.org/ns/odrl/2/"
+}
+
+# states passed through by negotiations and transfers, as fraction of the configured duration
+NEGOTIATION_STAGES = ((0.0, "REQUESTED"), (0.5, "AGREED"), (0.75, "VERIFIED"), (1.0, "FINALIZED"))
+TRANSFER_STAGES = ((0.0, "REQUESTED"), (0.5, "STARTED"), (1.0, "COMPLETED"))
+
+# stub connectors by dsp url, so a consumer stub can answer catalog requests and negotiations for a provider stub
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _now_millis():
+    return int(time.time() * 1000)
+
+
+def _b64(value):
+    return base64.b64encode(value.encode()).decode()
+
+
+def _unb64(value):
+    try:
+        return base64.b64decode(value.encode()).decode()
+    except ValueError:
+        return None
+
+
+def offer_id(contract_definition_id, asset_id):
+    # same layout as the EDC: definition, asset and a random part, each base64 encoded
+    return ":".join(_b64(part) for part in (contract_definition_id, asset_id, str(uuid.uuid4())))
+
+
+def parse_offer_id(value):
+    parts = (value or "").split(":")
+    if len(parts) != 3:
+        return None, None
+    return _unb64(parts[0]), _unb64(parts[1])
+
+
+def _field(entry, operand):
+    # value of a querySpec operand, with or without the edc namespace and also looked up in properties
+    key = operand
+    for prefix in (EDC_NAMESPACE, "edc:"):
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+    if key in ("id", "@id"):
+        return entry.get("@id")
+    value = entry
+    for part in key.split("."):
+        if not isinstance(value, dict):
+            return None
+        if part in value:
+            value = value[part]
+        elif isinstance(value.get("properties"), dict) and part in value["properties"]:
+            value = value["properties"][part]
+        else:
+            return None
+    return value
+
+
+def _like(value, pattern):
+    if not isinstance(value, str):
+        return False
+    parts = pattern.split("%")
+    if len(parts) == 1:
+        return value == pattern
+    if not value.startswith(parts[0]) or not value.endswith(parts[-1]):
+        return False
+    position = len(parts[0])
+    for part in parts[1:-1]:
+        position = value.find(part, position)
+        if position < 0:
+            return False
+        position += len(part)
+    return position <= len(value) - len(parts[-1])
+
+
+def matches(entry, criteria):
+    for criterion in criteria or []:
+        value = _field(entry, criterion.get("operandLeft", ""))
+        operator = criterion.get("operator", "=")
+        right = criterion.get("operandRight")
+        if operator == "=":
+            ok = value == right
+        elif operator == "!=":
+            ok = value != right
+        elif operator == "in":
+            ok = value in (right if isinstance(right, list) else [right])
+        elif operator == "like":
+            ok = _like(value, right)
+        else:
+            raise ValueError("unsupported operator " + str(operator))
+        if not ok:
+            return False
+    return True
+
+
+def apply_query_spec(entries, query_spec):
+    query_spec = query_spec or {}
+    selected = [entry for entry in entries if matches(entry, query_spec.get("filterExpression"))]
+    sort_field = query_spec.get("sortField")
+    if sort_field:
+        selected.sort(key=lambda entry: str(_field(entry, sort_field)),
+                      reverse=query_spec.get("sortOrder", "ASC") == "DESC")
+    offset = int(query_spec.get("offset", 0))
+    return selected[offset:offset + int(query_spec.get("limit", 50))]
+
+
+class _Process:
+    # a negotiation or transfer whose state advances with the time passed since it was created
+
+    def __init__(self, body, stages, duration, fails):
+        self.body = body
+        self.stages = stages
+        self.duration = duration
+        self.fails = fails
+        self.created = time.monotonic()
+        self.terminated = None
+        self.deprovisioned = False
+        self.agreement_id = None
+
+    @property
+    def progress(self):
+        if self.duration <= 0:
+            return 1.0
+        return (time.monotonic() - self.created) / self.duration
+
+    @property
+    def state(self):
+        if self.terminated is not None:
+            return "TERMINATED"
+        progress = self.progress
+        if progress >= 1.0 and self.fails:
+            return "TERMINATED"
+        state = self.stages[0][1]
+        for at, stage in self.stages:
+            if progress >= at:
+                state = stage
+        if state == self.stages[-1][1] and self.deprovisioned:
+            return "DEPROVISIONED"
+        return state
+
+    @property
+    def finished(self):
+        return self.state in (self.stages[-1][1], "TERMINATED", "DEPROVISIONED")
+
+    def document(self):
+        body = dict(self.body)
+        body["state"] = self.state
+        if body["state"] == "TERMINATED":
+            body["errorDetail"] = self.terminated or "terminated by stub connector"
+        return body
+
+
+class StubConnector(EmbeddedHttpServer):
+    """
+    In-process stand-in for the management API of an EDC connector, to run the flows of this repository without the
+    Java connectors. Covers dataplane instances, assets, policy definitions, contract definitions (with querySpec
+    requests), the catalog, contract negotiations and agreements, transfer processes and deprovisioning.
+
+    Every response is delayed by latency seconds (randomized by +/- latency_jitter), negotiations reach FINALIZED
+    negotiation_seconds after they were requested and transfers reach COMPLETED after transfer_seconds, passing
+    through the intermediate states on the way. failure_rate is the fraction of negotiations and transfers that end
+    in TERMINATED instead. Registered callback addresses receive the final event. With capacity set, requests
+    arriving while capacity requests are in flight are rejected with 429 like an overloaded connector, error_rate is
+    the fraction of requests answered with 503 without being processed. Negotiations and transfers requested with
+    an @id keep it, requesting the same id again is rejected with 409.
+
+    Catalog requests and negotiations are answered from the stub whose dsp_url is the counterPartyAddress, so two
+    stubs behave like provider and consumer. Requests per route are counted in requests.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, participant_id="provider", latency=0.0, latency_jitter=0.0,
+                 negotiation_seconds=0.5, transfer_seconds=0.5, failure_rate=0.0, api_key=None, capacity=None,
+                 error_rate=0.0):
+        super().__init__(host, port, "/management/", name="edc-stub-" + participant_id)
+        self.participant_id = participant_id
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.negotiation_seconds = negotiation_seconds
+        self.transfer_seconds = transfer_seconds
+        self.failure_rate = failure_rate
+        self.api_key = api_key
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.in_flight = 0
+        self.requests = Counter()
+        self.dataplanes = {}
+        self.assets = {}
+        self.policies = {}
+        self.contract_definitions = {}
+        self.negotiations = {}
+        self.agreements = {}
+        self.transfers = {}
+        self._collections = {
+            ("v3", "assets"): self.assets,
+            ("v2", "policydefinitions"): self.policies,
+            ("v2", "contractdefinitions"): self.contract_definitions
+        }
+        self._lock = threading.RLock()
+
+    @property
+    def management_url(self):
+        return self.url
+
+    @property
+    def dsp_url(self):
+        return "http://" + self.host + ":" + str(self.port) + "/protocol"
+
+    def start(self):
+        super().start()
+        with _registry_lock:
+            _registry[self.dsp_url] = self
+        return self
+
+    def stop(self):
+        with _registry_lock:
+            if _registry.get(self.dsp_url) is self:
+                del _registry[self.dsp_url]
+        super().stop()
+
+    async def handle(self, method, path, headers, reader):
+        body = await read_body(reader, headers)
+        if self.capacity is not None and self.in_flight >= self.capacity:
+            self.requests["rejected"] += 1
+            return 429, self._error("too many requests", "TooManyRequests")
+        if self.error_rate > 0 and random.random() < self.error_rate:
+            self.requests["unavailable"] += 1
+            return 503, self._error("service unavailable", "ServiceUnavailable")
+        self.in_flight += 1
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency * (1 + random.uniform(-self.latency_jitter, self.latency_jitter)))
+            return self._respond(method, path, headers, body)
+        finally:
+            self.in_flight -= 1
+
+    def _respond(self, method, path, headers, body):
+        if not path.startswith(self.path):
+            return 404, b""
+        if self.api_key is not None and headers.get("x-api-key") != self.api_key:
+            return 401, self._error("missing or wrong X-API-Key", "AuthenticationFailed")
+        parts = tuple(part for part in path.split("?", 1)[0][len(self.path):].split("/") if part)
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            return 400, self._error("malformed JSON body", "InvalidRequest")
+        try:
+            with self._lock:
+                status, response = self._route(method, parts, payload)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            status, response = 400, [{"message": repr(e), "type": "InvalidRequest"}]
+        if status == 204 or response is None:
+            return status, b""
+        return status, json.dumps(response).encode()
+
+    @staticmethod
+    def _error(message, error_type):
+        return json.dumps([{"message": message, "type": error_type}]).encode()
+
+    def _route(self, method, parts, payload):
+        # dispatches to the handler of a management API route, returns (status, JSON document)
+        if parts == ("instances",):
+            self.requests["instances"] += 1
+            if method == "GET":
+                return 200, list(self.dataplanes.values())
+            self.dataplanes[payload["id"]] = payload
+            return 204, None
+
+        if parts[:2] in self._collections:
+            return self._crud(method, parts, payload)
+        if parts == ("v2", "catalog", "request") and method == "POST":
+            self.requests["catalog"] += 1
+            return self._catalog(payload)
+        if parts[:2] == ("v2", "contractnegotiations"):
+            return self._processes(method, parts, payload, self.negotiations, self._create_negotiation)
+        if parts[:2] == ("v2", "transferprocesses"):
+            return self._processes(method, parts, payload, self.transfers, self._create_transfer)
+        if parts[:2] == ("v2", "contractagreements"):
+            return self._agreements(method, parts, payload)
+        return 404, [{"message": "no route for " + method + " /" + "/".join(parts), "type": "NotFound"}]
+
+    @staticmethod
+    def _not_found(kind, entry_id):
+        return 404, [{"message": "Object of type " + kind + " with ID=" + str(entry_id) + " was not found",
+                      "type": "ObjectNotFound"}]
+
+    @staticmethod
+    def _id_response(entry_id):
+        return {"@type": "IdResponse", "@id": entry_id, "createdAt": _now_millis(), "@context": RESPONSE_CONTEXT}
+
+    def _crud(self, method, parts, payload):
+        store = self._collections[parts[:2]]
+        kind = parts[1]
+        if len(parts) == 2 and method in ("POST", "PUT"):
+            self.requests[kind + " " + method.lower()] += 1
+            entry = {key: value for key, value in payload.items() if key != "@context"}
+            entry_id = entry.setdefault("@id", str(uuid.uuid4()))
+            if method == "POST" and entry_id in store:
+                return 409, [{"message": "Object of type " + kind + " with ID=" + entry_id + " already exists",
+                              "type": "ObjectConflict"}]
+            if method == "PUT" and entry_id not in store:
+                return self._not_found(kind, entry_id)
+            entry["createdAt"] = store[entry_id]["createdAt"] if method == "PUT" else _now_millis()
+            store[entry_id] = entry
+            return (200, self._id_response(entry_id)) if method == "POST" else (204, None)
+        if len(parts) == 3 and parts[2] == "request" and method == "POST":
+            self.requests[kind + " request"] += 1
+            return 200, apply_query_spec(store.values(), payload)
+        if len(parts) == 3 and method in ("GET", "DELETE"):
+            self.requests[kind + " " + method.lower()] += 1
+            entry = store.get(parts[2])
+            if entry is None:
+                return self._not_found(kind, parts[2])
+            if method == "DELETE":
+                del store[parts[2]]
+                return 204, None
+            return 200, dict(entry, **{"@context": RESPONSE_CONTEXT})
+        return 405, None
+
+    def _provider(self, address):
+        with _registry_lock:
+            return _registry.get((address or "").rstrip("/"), self)
+
+    def _offers(self, query_spec):
+        # datasets of this connector as seen by a consumer, one offer per contract definition selecting the asset
+        datasets = []
+        for asset in apply_query_spec(self.assets.values(), dict(query_spec or {}, offset=0, limit=len(self.assets))):
+            offers = [{
+                "@id": offer_id(definition["@id"], asset["@id"]),
+                "@type": "odrl:Offer",
+                "odrl:permission": [],
+                "odrl:prohibition": [],
+                "odrl:obligation": [],
+                "odrl:target": {"@id": asset["@id"]}
+            } for definition in self.contract_definitions.values()
+                if definition.get("accessPolicyId") in self.policies and
+                matches(asset, definition.get("assetsSelector"))]
+            if not offers:
+                continue
+            dataset = {
+                "@id": asset["@id"],
+                "@type": "dcat:Dataset",
+                "odrl:hasPolicy": offers[0] if len(offers) == 1 else offers,
+                "dcat:distribution": [{
+                    "@type": "dcat:Distribution",
+                    "dct:format": {"@id": "HttpData-PULL"},
+                    "dcat:accessService": self.participant_id
+                }]
+            }
+            dataset.update(asset.get("properties") or {})
+            datasets.append(dataset)
+        offset = int((query_spec or {}).get("offset", 0))
+        return datasets[offset:offset + int((query_spec or {}).get("limit", 50))]
+
+    def _catalog(self, payload):
+        provider = self._provider(payload.get("counterPartyAddress"))
+        with provider._lock:
+            datasets = provider._offers(payload.get("querySpec"))
+        return 200, {
+            "@id": str(uuid.uuid4()),
+            "@type": "dcat:Catalog",
+            # JSON-LD compaction turns single element lists into the element
+            "dcat:dataset": datasets[0] if len(datasets) == 1 else datasets,
+            "dspace:participantId": provider.participant_id,
+            "@context": RESPONSE_CONTEXT
+        }
+
+    def _fails(self):
+        return self.failure_rate > 0 and random.random() < self.failure_rate
+
+    def _create_negotiation(self, payload):
+        negotiation_id = payload.get("@id") or str(uuid.uuid4())
+        policy = payload.get("policy") or {}
+        provider = self._provider(payload.get("counterPartyAddress"))
+        definition_id, asset_id = parse_offer_id(policy.get("@id"))
+        with provider._lock:
+            known = definition_id in provider.contract_definitions and asset_id in provider.assets
+        agreement_id = str(uuid.uuid4())
+        process = _Process({
+            "@type": "ContractNegotiation",
+            "@id": negotiation_id,
+            "type": "CONSUMER",
+            "protocol": payload.get("protocol"),
+            "counterPartyId": payload.get("providerId"),
+            "counterPartyAddress": payload.get("counterPartyAddress"),
+            "callbackAddresses": payload.get("callbackAddresses", []),
+            "createdAt": _now_millis()
+        }, NEGOTIATION_STAGES, self.negotiation_seconds, self._fails())
+        if not known:
+            process.terminated = "contract offer " + str(policy.get("@id")) + " is not offered by the provider"
+        self.agreements[agreement_id] = {
+            "@type": "ContractAgreement",
+            "@id": agreement_id,
+            "assetId": asset_id,
+            "policy": dict(policy, **{"odrl:assignee": payload.get("consumerId"),
+                                      "odrl:assigner": payload.get("providerId")}),
+            "contractSigningDate": _now_millis() + int(self.negotiation_seconds * 1000),
+            "consumerId": payload.get("consumerId"),
+            "providerId": payload.get("providerId"),
+            "negotiationId": negotiation_id
+        }
+        process.agreement_id = agreement_id
+        return negotiation_id, process
+
+    def _create_transfer(self, payload):
+        transfer_id = payload.get("@id") or str(uuid.uuid4())
+        agreement = self.agreements.get(payload.get("contractId"))
+        process = _Process({
+            "@type": "TransferProcess",
+            "@id": transfer_id,
+            "type": "CONSUMER",
+            "protocol": payload.get("protocol"),
+            "assetId": agreement["assetId"] if agreement else payload.get("assetId"),
+            "contractId": payload.get("contractId"),
+            "connectorId": payload.get("connectorId"),
+            "dataDestination": payload.get("dataDestination"),
+            "callbackAddresses": payload.get("callbackAddresses", []),
+            "createdAt": _now_millis()
+        }, TRANSFER_STAGES, self.transfer_seconds, self._fails())
+        negotiation = self.negotiations.get(agreement["negotiationId"]) if agreement else None
+        if negotiation is None or negotiation.state != "FINALIZED":
+            process.terminated = "contract agreement " + str(payload.get("contractId")) + " is not valid"
+        return transfer_id, process
+
+    def _processes(self, method, parts, payload, store, create):
+        kind = parts[1]
+        if len(parts) == 2 and method == "POST":
+            self.requests[kind + " post"] += 1
+            if payload.get("@id") in store:
+                return 409, [{"message": "Object of type " + kind + " with ID=" + payload["@id"] + " already exists",
+                              "type": "ObjectConflict"}]
+            process_id, process = create(payload)
+            store[process_id] = process
+            self._schedule_callback(kind, process_id, process)
+            return 200, self._id_response(process_id)
+        if len(parts) == 3 and parts[2] == "request" and method == "POST":
+            self.requests[kind + " request"] += 1
+            return 200, apply_query_spec([self._process_document(process) for process in store.values()], payload)
+        process = store.get(parts[2]) if len(parts) >= 3 else None
+        if process is None:
+            return self._not_found(kind, parts[2] if len(parts) >= 3 else None)
+        if len(parts) == 3 and method == "GET":
+            self.requests[kind + " get"] += 1
+            return 200, dict(self._process_document(process), **{"@context": RESPONSE_CONTEXT})
+        if len(parts) == 4 and parts[3] == "state" and method == "GET":
+            self.requests[kind + " state"] += 1
+            return 200, {"@type": "NegotiationState" if store is self.negotiations else "TransferState",
+                         "state": process.state}
+        if len(parts) == 4 and parts[3] == "terminate" and method == "POST":
+            self.requests[kind + " terminate"] += 1
+            if not process.finished:
+                process.terminated = (payload or {}).get("reason", "terminated by request")
+            return 204, None
+        if len(parts) == 4 and parts[3] == "deprovision" and method == "POST" and store is self.transfers:
+            self.requests[kind + " deprovision"] += 1
+            process.deprovisioned = True
+            return 204, None
+        return 405, None
+
+    def _process_document(self, process):
+        document = process.document()
+        if document["@type"] == "ContractNegotiation" and document["state"] == "FINALIZED":
+            document["contractAgreementId"] = process.agreement_id
+        return document
+
+    def _finalized_agreements(self):
+        return [agreement for agreement in self.agreements.values()
+                if self.negotiations[agreement["negotiationId"]].state == "FINALIZED"]
+
+    def _agreements(self, method, parts, payload):
+        if len(parts) == 3 and parts[2] == "request" and method == "POST":
+            self.requests["contractagreements request"] += 1
+            return 200, apply_query_spec(self._finalized_agreements(), payload)
+        agreement = self.agreements.get(parts[2]) if len(parts) >= 3 else None
+        if agreement is None or self.negotiations[agreement["negotiationId"]].state != "FINALIZED":
+            return self._not_found("ContractAgreement", parts[2] if len(parts) >= 3 else None)
+        if len(parts) == 3 and method == "GET":
+            self.requests["contractagreements get"] += 1
+            return 200, dict(agreement, **{"@context": RESPONSE_CONTEXT})
+        if len(parts) == 4 and parts[3] == "negotiation" and method == "GET":
+            self.requests["contractagreements negotiation"] += 1
+            return 200, self._process_document(self.negotiations[agreement["negotiationId"]])
+        return 405, None
+
+    def _schedule_callback(self, kind, process_id, process):
+        addresses = [address for address in process.body.get("callbackAddresses") or []
+                     if address.get("uri")]
+        if not addresses:
+            return
+        loop = asyncio.get_running_loop()
+
+        def fire():
+            with self._lock:
+                if not process.finished:
+                    # not there yet, e.g. because the timer fired early
+                    loop.call_later(max(0.0, (1.0 - process.progress) * process.duration), fire)
+                    return
+                document = self._process_document(process)
+            if kind == "contractnegotiations":
+                event = "contract.negotiation"
+                if document["state"] == "FINALIZED":
+                    event_type = "ContractNegotiationFinalized"
+                    payload = {"contractNegotiationId": process_id,
+                               "contractAgreement": {"@id": document["contractAgreementId"],
+                                                     "id": document["contractAgreementId"]}}
+                else:
+                    event_type = "ContractNegotiationTerminated"
+                    payload = {"contractNegotiationId": process_id, "errorDetail": document.get("errorDetail")}
+            else:
+                event = "transfer.process"
+                event_type = "TransferProcessCompleted" if document["state"] != "TERMINATED" else \
+                    "TransferProcessTerminated"
+                payload = {"transferProcessId": process_id, "errorDetail": document.get("errorDetail")}
+            for address in addresses:
+                if any(event.startswith(prefix) or prefix.startswith(event) for prefix in address.get("events", [])):
+                    loop.run_in_executor(None, self._post_event, address["uri"],
+                                         {"id": str(uuid.uuid4()), "at": _now_millis(), "type": event_type,
+                                          "payload": payload})
+
+        loop.call_later(max(0.0, process.duration), fire)
+
+    @staticmethod
+    def _post_event(uri, event):
+        try:
+            requests.post(uri, data=json.dumps(event), headers={"Content-Type": "application/json"}, timeout=5)
+        except requests.RequestException:
+            pass
+
+
+class StubDataSource(EmbeddedHttpServer):
+    """
+    Stand-in for the public API of a provider data plane serving payload to GET requests carrying auth_code in the
+    Authorization header. Range requests (bytes=start-end) are answered with 206 and a Content-Range header, like the
+    data plane proxying a source that supports them, with ranges=False the whole payload is returned with 200.
+    """
+
+    def __init__(self, payload, host="127.0.0.1", port=0, auth_code="token", ranges=True):
+        super().__init__(host, port, "/public", name="edc-stub-data")
+        self.payload = payload
+        self.auth_code = auth_code
+        self.ranges = ranges
+        self.requests = Counter()
+
+    def edr(self):
+        # an EDR for the payload as the consumer connector would push it
+        return {"endpoint": self.url, "authKey": "Authorization", "authCode": self.auth_code}
+
+    async def handle(self, method, path, headers, reader):
+        await read_body(reader, headers)
+        if method != "GET" or not path.startswith(self.path):
+            return 404, b""
+        if headers.get("authorization") != self.auth_code:
+            return 401, b""
+        requested = headers.get("range", "")
+        if not self.ranges or not requested.startswith("bytes="):
+            self.requests["full"] += 1
+            return 200, self.payload
+        first, _, last = requested[len("bytes="):].partition("-")
+        start = int(first)
+        end = min(int(last) if last else len(self.payload) - 1, len(self.payload) - 1)
+        if start >= len(self.payload):
+            return 416, b"", {"Content-Range": "bytes */" + str(len(self.payload))}
+        self.requests["ranged"] += 1
+        return 206, self.payload[start:end + 1], \
+            {"Content-Range": "bytes " + str(start) + "-" + str(end) + "/" + str(len(self.payload))}
@@ -0,0 +1,53 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import argparse
+
+from icecream import ic
+
+from common import create_criterion, edc2_headers
+from inventory_sync import load_manifest, sync_assets
+
+"""
+Syncs the assets of the provider connector with a manifest, a JSON list of asset bodies as built by
+common.create_asset_data. Only assets that differ from the manifest are written.
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument("manifest")
+parser.add_argument("--management-url", default="http://localhost:19193/management/")
+parser.add_argument("--prune", action="store_true",
+                    help="delete assets that are not in the manifest, only those matching --filter if given")
+parser.add_argument("--filter", action="append", default=[], metavar="PROPERTY=VALUE",
+                    help="only list and prune assets with this property value, can be repeated")
+parser.add_argument("--dry-run", action="store_true", help="only print the planned changes")
+parser.add_argument("--workers", type=int, default=16)
+args = parser.parse_args()
+
+filter_expression = []
+for condition in args.filter:
+    operand, _, value = condition.partition("=")
+    filter_expression.append(create_criterion(operand, "=", value))
+
+ic.disable()
+plan, result = sync_assets(load_manifest(args.manifest), args.management_url, edc2_headers, prune=args.prune,
+                           filter_expression=filter_expression, dry_run=args.dry_run, workers=args.workers)
+ic.enable()
+
+ic(len(plan.creates), len(plan.updates), len(plan.deletes), plan.unchanged)
+if not args.dry_run:
+    ic(len(result.succeeded), len(result.failed), result.items_per_second)
+    for operation, error in result.failed:
+        ic(operation[0], operation[1] if operation[0] == "delete" else operation[1]["@id"], error)
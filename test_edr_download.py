@@ -0,0 +1,59 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import os
+import tempfile
+import unittest
+
+from edr_download import download
+from stub_connector import StubDataSource
+
+PART_SIZE = 1024 * 1024
+
+
+class DownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        # three full parts and a partial one
+        self.payload = os.urandom(3 * PART_SIZE + 123)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "download.bin")
+
+    def download(self, parallel, ranges=True):
+        with StubDataSource(self.payload, ranges=ranges) as source:
+            result = download(source.edr(), self.path, parallel=parallel, part_size=PART_SIZE)
+        with open(self.path, "rb") as f:
+            self.assertEqual(self.payload, f.read())
+        self.assertEqual(len(self.payload), result.size)
+        return result
+
+    def test_parallel_ranged_download(self):
+        result = self.download(parallel=4)
+        self.assertTrue(result.ranged)
+        self.assertEqual(4, result.requests)
+
+    def test_sequential_ranged_download_fetches_all_parts(self):
+        # parallel=1 used to write only the first part of a source answering the probe with 206
+        result = self.download(parallel=1)
+        self.assertEqual(4, result.requests)
+
+    def test_source_without_ranges(self):
+        result = self.download(parallel=4, ranges=False)
+        self.assertFalse(result.ranged)
+
+
+if __name__ == "__main__":
+    unittest.main()
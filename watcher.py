@@ -0,0 +1,179 @@
+"""
+  Copyright 2024 Dataport. All rights reserved. Developed as part of the MERLOT project.
+
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+"""
+import threading
+import time
+from concurrent.futures import Future
+
+from icecream import ic
+
+from common import create_query_spec, create_criterion, query_negotiations, query_transfer_processes
+from polling import PollFailedError, PollTimeoutError, NEGOTIATION_DONE_STATES, NEGOTIATION_FAILED_STATES, \
+    TRANSFER_DONE_STATES, TRANSFER_FAILED_STATES, is_failed
+
+_KINDS = {
+    "negotiation": (query_negotiations, NEGOTIATION_DONE_STATES, NEGOTIATION_FAILED_STATES),
+    "transfer": (query_transfer_processes, TRANSFER_DONE_STATES, TRANSFER_FAILED_STATES),
+}
+
+
+def _group_key(kind, connector_management_url, edc_headers):
+    return kind, connector_management_url, tuple(sorted(edc_headers.items()))
+
+
+class _Watch:
+    def __init__(self, future, deadline):
+        self.future = future
+        self.deadline = deadline
+        self.state = None
+        self.polls = 0
+
+
+class StatusWatcher:
+    """
+    Tracks many negotiation and transfer ids and fetches their states in bulk.
+
+    Every tick sends one query per connector and kind (v2/contractnegotiations/request or
+    v2/transferprocesses/request) with an "id in [...]" filter, so the number of requests per tick does not grow
+    with the number of watched ids. Each watch_* call returns a concurrent.futures.Future that resolves with the
+    status body once a done state is reached, or fails with PollFailedError/PollTimeoutError. Use
+    asyncio.wrap_future to await it from a coroutine. The optional callback receives the future once it is done.
+    """
+
+    def __init__(self, interval=1.0, deadline=600.0, batch_size=500, client=None, verbose=False):
+        self.interval = interval
+        self.deadline = deadline
+        self.batch_size = batch_size
+        self.client = client
+        self.verbose = verbose
+        self.ticks = 0
+        self.requests_sent = 0
+        # (kind, connector_management_url, header items) -> (edc_headers, {id: _Watch})
+        self._groups = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def watch_negotiation(self, connector_management_url, negotiation_id, edc_headers, callback=None, deadline=None):
+        return self._watch("negotiation", connector_management_url, negotiation_id, edc_headers, callback, deadline)
+
+    def watch_transfer(self, connector_management_url, transfer_id, edc_headers, callback=None, deadline=None):
+        return self._watch("transfer", connector_management_url, transfer_id, edc_headers, callback, deadline)
+
+    def _watch(self, kind, connector_management_url, process_id, edc_headers, callback, deadline):
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        deadline = deadline if deadline is not None else self.deadline
+        expires = time.monotonic() + deadline if deadline is not None else None
+        with self._lock:
+            group = self._groups.setdefault(_group_key(kind, connector_management_url, edc_headers), (edc_headers, {}))
+            group[1][process_id] = _Watch(future, expires)
+        self._wakeup.set()
+        return future
+
+    def pending(self):
+        with self._lock:
+            return sum(len(watches) for _, watches in self._groups.values())
+
+    def tick(self):
+        self.ticks += 1
+        with self._lock:
+            groups = [(key, edc_headers, dict(watches)) for key, (edc_headers, watches) in self._groups.items()
+                      if watches]
+        for (kind, connector_management_url, _), edc_headers, watches in groups:
+            self._tick_group(kind, connector_management_url, edc_headers, watches)
+
+    def _tick_group(self, kind, connector_management_url, edc_headers, watches):
+        query, done_states, failed_states = _KINDS[kind]
+        ids = list(watches)
+        results = {}
+        for offset in range(0, len(ids), self.batch_size):
+            chunk = ids[offset:offset + self.batch_size]
+            query_spec = create_query_spec(limit=len(chunk),
+                                           filter_expression=[create_criterion("id", "in", chunk)])
+            try:
+                status_code, body = query(connector_management_url, edc_headers, query_spec, self.client)
+            except Exception as e:
+                # connector unreachable, try again on the next tick
+                if self.verbose:
+                    ic(kind, connector_management_url, e)
+                continue
+            finally:
+                self.requests_sent += 1
+            if status_code >= 400 or not isinstance(body, list):
+                if self.verbose:
+                    ic(kind, connector_management_url, status_code, body)
+                continue
+            for entry in body:
+                results[entry.get("@id")] = entry
+
+        now = time.monotonic()
+        for process_id, watch in watches.items():
+            watch.polls += 1
+            entry = results.get(process_id)
+            if entry is not None:
+                watch.state = entry.get("state")
+            if is_failed(watch.state, entry, failed_states):
+                self._resolve(kind, connector_management_url, edc_headers, process_id,
+                              error=PollFailedError(kind + " " + process_id + " ended in state " + watch.state +
+                                                    ": " + str(entry.get("errorDetail")),
+                                                    state=watch.state, body=entry, polls=watch.polls))
+            elif watch.state in done_states:
+                self._resolve(kind, connector_management_url, edc_headers, process_id, result=entry)
+            elif watch.deadline is not None and now >= watch.deadline:
+                self._resolve(kind, connector_management_url, edc_headers, process_id,
+                              error=PollTimeoutError(kind + " " + process_id + " did not finish in time, last state " +
+                                                     str(watch.state), state=watch.state, polls=watch.polls))
+
+    def _resolve(self, kind, connector_management_url, edc_headers, process_id, result=None, error=None):
+        with self._lock:
+            watch = self._groups[_group_key(kind, connector_management_url, edc_headers)][1].pop(process_id, None)
+        if watch is None or watch.future.done():
+            return
+        if error is not None:
+            watch.future.set_exception(error)
+        else:
+            watch.future.set_result(result)
+
+    def run(self):
+        while not self._stopped.is_set():
+            if self.pending() == 0:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            self.tick()
+            self._stopped.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self.run, name="edc-status-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()